@@ -1,41 +1,94 @@
 #!/usr/bin/python3
 
+import secrets
+import argparse
 import numpy
-import random # Warning standand RNGs cannot use to generate lattice problems: fix this!
-import sys
-
-def gen_basis(n, r, q):
-    U = [ [ random.randrange(int(q)) for i in range(n-1) ] + [0] for j in range(r) ]
-    v = [ random.randrange(3) - 1 for i in range(n-1) ]
-    for j in range(r):
-        for i in range(n-1):
-            U[j][n-1] += 2*q - v[i]*U[j][i]
-        U[j][n-1] = U[j][n-1] % q
-
-    B = [ [ 0 for i in range(n+r) ] for j in range(n+r) ]
-    for i in range(n):
-        B[i][i] = 1
-    for i in range(n,n+r):
-        B[i][i] = q
-        for j in range(n):
-            B[i][j] = U[i-n][j]
-    w = v + [1] + ([ 0 ] * r) 
-
-    A = numpy.array(B)
-    return (A,w)
+from numpy.random import default_rng
+
+def gen_basis(n, r, q, rng=None, dtype=numpy.int64):
+    """
+        Generates an Ajtai-style q-ary lattice with a planted short vector w.
+        The basis is built directly as an integer matrix whose columns are the
+        basis vectors: the identity on the first n coordinates with the rows of
+        U below it, followed by q times the unit vectors of the last r coordinates.
+        The last column of U is chosen so that U.v' = 0 mod q for v' = v + [1],
+        which puts w = v + [1] + [0]*r in the lattice.
+
+        Parameters:
+            n:      Number of vectors
+            r:      Dimension of vectors
+            q:      Prime modulus
+            rng:    Seed or numpy Generator. Without one, the generator is
+                    seeded with 128 bits from the secrets module.
+            dtype:  Integer dtype of the basis
+
+        Returns:
+            A:      (n+r, n+r) basis matrix
+            w:      The planted short vector
+    """
+    dtype = numpy.dtype(dtype)
+    q = int(q)
+    # Entries of the basis are at most q, and the row sums below stay under n*q
+    if n*q >= numpy.iinfo(numpy.int64).max or q > numpy.iinfo(dtype).max:
+        raise OverflowError("q = %d does not fit the basis dtype %s" % (q, dtype))
+
+    rng = default_rng(secrets.randbits(128) if rng is None else rng)
+    U = numpy.zeros((r, n), dtype=numpy.int64)
+    U[:, :n-1] = rng.integers(0, q, size=(r, n-1))
+    v = rng.integers(-1, 2, size=n-1)
+    U[:, n-1] = (-(U[:, :n-1] @ v)) % q
+
+    A = numpy.zeros((n+r, n+r), dtype=dtype)
+    A[:n, :n] = numpy.eye(n, dtype=dtype)
+    A[n:, :n] = U
+    A[n:, n:] = q*numpy.eye(r, dtype=dtype)
+    w = numpy.concatenate((v, [1], numpy.zeros(r, dtype=numpy.int64))).astype(dtype)
+    return (A, w)
+
+def save_basis(path, A):
+    """
+        Writes a basis to disk. Files ending in .npy are written with numpy.save,
+        anything else in the fplll text format, one basis vector per row.
+
+        Parameters:
+            path:   Output file
+            A:      Basis matrix, one basis vector per column
+    """
+    if path.endswith('.npy'):
+        numpy.save(path, A)
+        return
+    with open(path, 'w') as f:
+        f.write("[" + "\n".join("[" + " ".join(str(int(x)) for x in b) + "]" for b in A.T) + "\n]\n")
+
+def load_basis(path, dtype=numpy.int64):
+    """
+        Reads a basis written by save_basis()
+
+        Parameters:
+            path:   Input file, .npy or fplll text format
+            dtype:  Integer dtype of the basis
+
+        Returns:
+            A:      Basis matrix, one basis vector per column
+    """
+    if path.endswith('.npy'):
+        return numpy.load(path).astype(dtype, copy=False)
+    with open(path) as f:
+        rows = [line.strip().strip('[]').split() for line in f.read().split('\n')]
+    return numpy.array([[int(x) for x in row] for row in rows if row], dtype=dtype).T
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: %s <n> <r> <q>" % sys.argv[0])
-        print("  n = number of vectors")
-        print("  r = dimension of vectors (want c2*r*log(r) <= n <= r^c3)")
-        print("  q = prime modulus (want r^c1 < q < 2r^c1 with q)")
-        sys.exit(2)
-
-    n = int(sys.argv[1])
-    r = int(sys.argv[2])
-    q = int(sys.argv[3])
-
-    A, w = gen_basis(n, r, q)
-    print (A)
+    parser = argparse.ArgumentParser(description='Generates an Ajtai lattice basis with a planted short vector')
+    parser.add_argument('n', type=int, help='number of vectors')
+    parser.add_argument('r', type=int, help='dimension of vectors (want c2*r*log(r) <= n <= r^c3)')
+    parser.add_argument('q', type=int, help='prime modulus (want r^c1 < q < 2r^c1 with q)')
+    parser.add_argument('--seed', type=int, help='seed for reproducible instances')
+    parser.add_argument('--out', metavar='file', help='write the basis to this file (.npy, otherwise fplll format)')
+    args = parser.parse_args()
+
+    A, w = gen_basis(args.n, args.r, args.q, args.seed)
+    if args.out is not None:
+        save_basis(args.out, A)
+    else:
+        print (A)
     print ("", w)
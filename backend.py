@@ -0,0 +1,152 @@
+import numpy as np
+from pair_search import tile_pairs
+from g_sieve import reduce_by
+from nv_sieve import first_close
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+class NumpyBackend:
+    """
+        The hot kernels of the sieves, as vectorized NumPy code. A backend is
+        passed to the sieves (backend=...) and swaps these three kernels, the
+        rest of every sieve is shared:
+
+            tile_pairs(A, sq_A, B, sq_B, gR2, diagonal, prefilter)
+                the reducible pairs of a tile, see pair_search.tile_pairs()
+            reduce_by(p, V, sq)
+                reduces p in place by the shorter rows of V, see g_sieve.reduce_by()
+            first_close(V, v, gR2)
+                the first row of V close to v, see nv_sieve.first_close()
+
+        Every backend returns exactly the same results, in the same order, as
+        long as inner products fit in 53 bits.
+
+        Attributes:
+            name:   Name of the backend for --backend
+    """
+    name = 'numpy'
+    tile_pairs = staticmethod(tile_pairs)
+    reduce_by = staticmethod(reduce_by)
+    first_close = staticmethod(first_close)
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _dot(a, b):
+        # Exact integer inner product of two rows
+        s = 0
+        for t in range(a.shape[0]):
+            s += np.int64(a[t])*np.int64(b[t])
+        return s
+
+    @numba.njit(cache=True)
+    def _same(a, b, sign):
+        # True if a == -sign*b, i.e. a + sign*b = 0
+        for t in range(a.shape[0]):
+            if np.int64(a[t]) + sign*np.int64(b[t]) != 0:
+                return False
+        return True
+
+    @numba.njit(cache=True)
+    def _tile_pairs(A, sq_A, B, sq_B, gR2, diagonal):
+        na, nb = A.shape[0], B.shape[0]
+        ma, mb = np.empty(na*nb, np.intp), np.empty(na*nb, np.intp)
+        pa, pb = np.empty(na*nb, np.intp), np.empty(na*nb, np.intp)
+        nm = npl = 0
+        for i in range(na):
+            for j in range(i + 1 if diagonal else 0, nb):
+                base = sq_A[i] + sq_B[j]
+                g = 2.0*_dot(A[i], B[j])
+                if base - g <= gR2 and not _same(A[i], B[j], -1):
+                    ma[nm], mb[nm] = i, j
+                    nm += 1
+                elif base + g <= gR2 and not _same(A[i], B[j], 1):
+                    pa[npl], pb[npl] = i, j
+                    npl += 1
+        return ma[:nm], mb[:nm], pa[:npl], pb[:npl]
+
+    @numba.njit(cache=True)
+    def _reduce_by(p, V, sq):
+        p_sq = float(_dot(p, p))
+        while True:
+            k = np.searchsorted(sq, p_sq, side='right')
+            best, best_gain, best_m = -1, 0.0, 0.0
+            for i in range(k):
+                ip = _dot(V[i], p)
+                m = np.rint(ip / sq[i])
+                gain = m*(2.0*ip - m*sq[i])
+                if gain > best_gain:
+                    best, best_gain, best_m = i, gain, m
+            if best < 0:
+                break
+            m = np.int64(best_m)
+            for t in range(p.shape[0]):
+                p[t] -= m*V[best, t]
+            p_sq = float(_dot(p, p))
+        return p_sq
+
+    @numba.njit(cache=True)
+    def _first_close(V, v, gR2):
+        for i in range(V.shape[0]):
+            s = 0
+            for t in range(v.shape[0]):
+                x = np.int64(V[i, t]) - np.int64(v[t])
+                s += x*x
+                # The partial sums only grow, so stop as soon as one is too large
+                if s > gR2:
+                    break
+            if s <= gR2:
+                return i
+        return -1
+
+    class NumbaBackend(NumpyBackend):
+        """
+            The kernels of NumpyBackend as loops compiled with Numba, over exact
+            int64 arithmetic. They skip the temporaries and the per-call
+            overhead of NumPy on small vectors, and first_close() stops at the
+            first close center and at the first coordinate that rules one out.
+            The first call of each kernel compiles it (cached on disk).
+        """
+        name = 'numba'
+
+        @staticmethod
+        def tile_pairs(A, sq_A, B, sq_B, gR2, diagonal=False, prefilter=False):
+            # Every pair is tested exactly, so prefilter changes nothing here
+            ma, mb, pa, pb = _tile_pairs(np.asarray(A), np.asarray(sq_A), np.asarray(B), np.asarray(sq_B), float(gR2), diagonal)
+            sign = np.concatenate((np.full(len(ma), -1, dtype=np.int8), np.ones(len(pa), dtype=np.int8)))
+            return np.concatenate((ma, pa)), np.concatenate((mb, pb)), sign
+
+        @staticmethod
+        def reduce_by(p, V, sq):
+            return p, _reduce_by(p, np.asarray(V), np.asarray(sq))
+
+        @staticmethod
+        def first_close(V, v, gR2):
+            return int(_first_close(np.asarray(V), np.asarray(v), float(gR2)))
+
+BACKENDS = {'numpy': NumpyBackend}
+if numba is not None:
+    BACKENDS['numba'] = NumbaBackend
+
+def get_backend(name=None):
+    """
+        Looks up a kernel backend
+
+        Parameters:
+            name:       'numpy', 'numba' or None for numpy
+
+        Returns:
+            backend:    The backend
+
+        Raises:
+            ValueError: If the backend is unknown or its package is not installed
+    """
+    if name is None or name == 'numpy':
+        return NumpyBackend()
+    if name == 'numba' and numba is None:
+        raise ValueError("The numba backend needs the numba package")
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend " + name)
+    return BACKENDS[name]()
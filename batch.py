@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+
+import io
+import os
+import csv
+import sys
+import json
+import time
+import shlex
+import signal
+import argparse
+import contextlib
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from numpy.linalg import norm
+from bench import grid_point
+from sieve import parse_args, solve
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class JobTimeout(Exception):
+    """ Raised in a job that overran its hard time limit """
+
+def _alarm(signum, frame):
+    raise JobTimeout()
+
+def job_key(job):
+    """ Identifies a job by its instance and its sieve arguments """
+    return json.dumps([job['n'], job['r'], job['q'], job['seed'], job['args']])
+
+def load_manifest(path):
+    """
+        Reads the jobs of a manifest. Every row has the Ajtai parameters n, r, q,
+        an optional seed (0 by default) and args, the sieve command line after
+        the basis parameters, e.g. "--preprocess lll gauss -c 30".
+
+        Parameters:
+            path:   A .csv file with a header, or a JSON Lines file
+
+        Returns:
+            jobs:   List of job dicts
+    """
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f)) if path.endswith('.csv') else [json.loads(line) for line in f if line.strip()]
+    return [{'n': int(row['n']), 'r': int(row['r']), 'q': int(row['q']), 'seed': int(row.get('seed') or 0),
+             'args': row['args']} for row in rows]
+
+def grid_jobs(grid, seeds, sieve_args):
+    """ One job per (n, r, q) in the grid, seed and sieve command line """
+    return [{'n': n, 'r': r, 'q': q, 'seed': seed, 'args': a} for n, r, q in grid for a in sieve_args for seed in seeds]
+
+def run_job(job, time_limit=None, memory_limit=None):
+    """
+        Solves one instance in a job process. The time limit is passed to the
+        sieve as its --max-time budget, so it returns its best vector when the
+        time is up, and is enforced with an alarm a little later in case the
+        sieve does not get to check it (e.g. during preprocessing). The memory
+        limit caps the address space of the job process, so an oversized job fails
+        with a MemoryError instead of taking the machine down.
+
+        Parameters:
+            job:            Job dict, see load_manifest()
+            time_limit:     Seconds, None for no limit
+            memory_limit:   MB, None for no limit
+
+        Returns:
+            result:         The job with its status (ok, timeout, memory or error),
+                            vector, norm, iterations, wall time and phase timings
+    """
+    result = dict(job)
+    last = {}
+    argv = ['-n', str(job['n']), '-r', str(job['r']), '-q', str(job['q']), '--seed', str(job['seed'])]
+    if time_limit is not None:
+        argv += ['--max-time', str(time_limit)]
+    argv += shlex.split(job['args'])
+
+    if memory_limit is not None and resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (int(memory_limit)*2**20, hard))
+    if time_limit is not None:
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.alarm(int(time_limit*1.1) + 5)
+
+    t = time.perf_counter()
+    err = io.StringIO()
+    try:
+        # Usage errors and the sieves' own printing do not belong in the results
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(err):
+            v = solve(parse_args(argv), callback=last.update)
+        result['status'] = 'timeout' if time_limit is not None and time.perf_counter() - t >= time_limit else 'ok'
+        result['v'] = None if v is None else [int(x) for x in v]
+        result['norm'] = None if v is None else float(norm(v))
+    except JobTimeout:
+        result['status'] = 'timeout'
+    except MemoryError:
+        result['status'] = 'memory'
+    except (Exception, SystemExit) as e:
+        result['status'] = 'error'
+        result['error'] = err.getvalue().strip().split("\n")[-1] or repr(e)
+    finally:
+        signal.alarm(0)
+
+    result['wall_time'] = time.perf_counter() - t
+    result['iterations'] = last.get('iteration')
+    result['timings'] = {k[5:]: v for k, v in last.items() if k.startswith('time_')}
+    return result
+
+def _child(send, task):
+    # Runs one job and sends its result back to the batch
+    send.send(run_job(*task))
+    send.close()
+
+def run_jobs(tasks, workers):
+    """
+        Runs every job in a process of its own, at most `workers` at a time,
+        and yields the results as the jobs finish. Every job gets a fresh
+        process, so that its memory limit and peak memory do not carry over to
+        the next one. Unlike the workers of a Pool, the processes are not
+        daemonic, so a job can start a pool itself (e.g. double -workers 4).
+
+        Parameters:
+            tasks:      Arguments of run_job() for every job
+            workers:    Number of jobs run at once
+
+        Yields:
+            result:     The result of a job, see run_job()
+    """
+    tasks = iter(tasks)
+    running = {}
+    while True:
+        for task in tasks:
+            recv, send = Pipe(duplex=False)
+            p = Process(target=_child, args=(send, task))
+            p.start()
+            send.close()
+            running[recv] = (p, task)
+            if len(running) >= workers:
+                break
+        if not running:
+            return
+        for recv in wait(list(running)):
+            p, task = running.pop(recv)
+            try:
+                result = recv.recv()
+            except EOFError:
+                # The process died without a result, e.g. killed by the OS
+                result = dict(task[0], status='error', error='job process exited with code ' + str(p.exitcode))
+            recv.close()
+            p.join()
+            yield result
+
+def main(args):
+    """
+        Solves every job of the manifest or grid in parallel and appends
+        each result to the results file as a JSON line as soon as it is done.
+        Jobs with a result in the file, other than an error, are skipped, so an
+        interrupted batch continues where it stopped.
+
+        Parameters:
+            args:   Namespace with the parsed command line arguments
+    """
+    jobs = load_manifest(args.manifest) if args.manifest is not None else grid_jobs(args.grid, args.seeds, args.args)
+
+    done = set()
+    if os.path.exists(args.out):
+        with open(args.out) as f:
+            done = {job_key(res) for res in map(json.loads, filter(str.strip, f)) if res.get('status') != 'error'}
+    todo = [job for job in jobs if job_key(job) not in done]
+    print("%d jobs, %d already done" % (len(jobs), len(jobs) - len(todo)), file=sys.stderr)
+
+    # Job processes are forked from this process, which has NumPy and the
+    # sieves imported already
+    workers = args.workers or os.cpu_count() or 1
+    with open(args.out, 'a') as f:
+        for res in run_jobs([(job, args.time_limit, args.memory_limit) for job in todo], workers):
+            f.write(json.dumps(res, default=lambda x: x.item()) + "\n")
+            f.flush()
+            print("%-8s n=%-4d r=%-4d q=%-6d seed=%-4d %s" % (res['status'], res['n'], res['r'], res['q'], res['seed'], res['args']), file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Solves many lattice instances in parallel')
+    jobs_group = parser.add_mutually_exclusive_group(required=True)
+    jobs_group.add_argument('-manifest', metavar='file', help='Jobs to run, .csv or JSON Lines with n, r, q, seed and args')
+    jobs_group.add_argument('-grid', metavar='n,r,q', type=grid_point, nargs='+', help='Ajtai parameters to run')
+    parser.add_argument('-seeds', metavar='seed', type=int, nargs='+', default=[0], help='Instance seeds for the grid (default 0)')
+    parser.add_argument('-args', metavar='args', nargs='+', default=['gauss -c 10'], help='Sieve command lines for the grid, e.g. "--preprocess lll gauss -c 30" (default "gauss -c 10")')
+    parser.add_argument('-workers', metavar='workers', type=int, default=0, help='Number of jobs run at once (default 0 = all cores)')
+    parser.add_argument('-time-limit', metavar='seconds', type=float, help='Time limit per job')
+    parser.add_argument('-memory-limit', metavar='MB', type=int, help='Address space limit per job')
+    parser.add_argument('-out', metavar='file', default='results.jsonl', help='Results file, appended to (default results.jsonl)')
+    main(parser.parse_args())
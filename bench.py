@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+from multiprocessing import Process, Pipe
+from numpy.linalg import norm
+from metrics import Metrics, peak_rss
+
+SIEVES = ['nv', 'gauss', 'double', 'double-par']
+
+def minkowski(n, r, q):
+    """ Minkowski bound of an Ajtai lattice with parameters n, r, q """
+    d = n + r
+    return (d**(0.5))*(q**r)**(1/d)
+
+def run_case(sieve, n, r, q, seed, params):
+    """
+        Runs one sieve on one seeded instance and measures it
+
+        Parameters:
+            sieve:  One of SIEVES
+            n:      Number of vectors for Ajtai generator
+            r:      Dimension of vectors for Ajtai generator
+            q:      Prime modulus for Ajtai generator
+            seed:   Seed for the basis and the sampler
+            params: Dict with the sieve parameters N, gamma, c and workers
+
+        Returns:
+            result: Dict with the wall time, vectors processed per second,
+                    peak RSS and final norm relative to the Minkowski bound
+    """
+    from ajtai_generator import gen_basis
+    from sample import sample_vec
+
+    rng = np.random.default_rng(seed)
+    basis, w = gen_basis(n, r, q, rng)
+    d = n + r
+    bound = minkowski(n, r, q)
+
+    # Count the vectors each sieve touches: the set sizes of every iteration
+    # for NV and double, the loop count for Gauss
+    processed = [0]
+    def count(row):
+        processed[0] = row['iteration'] if row['sieve'] == 'gauss' else processed[0] + row['size']
+    metrics = Metrics(callback=count)
+
+    N = params['N'] or int(2**(0.208*d))
+    t = time.perf_counter()
+    if sieve == 'nv':
+        from nv_sieve import nguyen_vidick_sieve
+        S = sample_vec(basis, N, n, r, q, rng)
+        v = nguyen_vidick_sieve(S, params['gamma'], rng=rng, metrics=metrics)
+    elif sieve == 'gauss':
+        from g_sieve import gauss_sieve
+        v = gauss_sieve(basis, params['c'], rng, metrics=metrics)
+    else:
+        from k_sieve import double_sieve
+        S = sample_vec(basis, N, n, r, q, rng)
+        workers = params['workers'] if sieve == 'double-par' else 1
+        v = double_sieve(S, params['gamma'], bound, workers=workers, rng=rng, metrics=metrics)
+    wall = time.perf_counter() - t
+
+    return {'sieve': sieve, 'n': n, 'r': r, 'q': q, 'seed': seed, 'wall_time': wall,
+            'vectors_per_s': processed[0] / wall if wall > 0 else None, 'peak_rss_kb': peak_rss(),
+            'norm': float(norm(v)), 'norm_over_minkowski': float(norm(v)) / bound}
+
+def _child(conn, args):
+    # Runs a case in a fresh process so that peak RSS is per case
+    try:
+        conn.send(run_case(*args))
+    except Exception as e:
+        conn.send({'error': repr(e)})
+    conn.close()
+
+def isolated(*args):
+    """
+        Runs run_case() in a separate process and returns its result
+    """
+    recv, send = Pipe(duplex=False)
+    p = Process(target=_child, args=(send, args))
+    p.start()
+    result = recv.recv()
+    p.join()
+    return result
+
+def main(args):
+    """
+        Runs every sieve on every (n, r, q) in the grid for every seed and
+        writes the results, with a description of the machine, as JSON.
+        With -compare, prints the speedup against an earlier result file.
+
+        Parameters:
+            args:   Namespace with the parsed command line arguments
+    """
+    params = {'N': args.N, 'gamma': args.gamma, 'c': args.c, 'workers': args.workers}
+    results = []
+    for n, r, q in args.grid:
+        for sieve in args.sieves:
+            for seed in args.seeds:
+                res = isolated(sieve, n, r, q, seed, params)
+                res.update({'sieve': sieve, 'n': n, 'r': r, 'q': q, 'seed': seed})
+                results.append(res)
+                print(json.dumps(res), file=sys.stderr)
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'params': params}
+    with open(args.out, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+    if args.compare is not None:
+        compare(args.compare, results)
+
+def compare(path, results):
+    """
+        Prints the wall time ratio old/new for every case present in both runs
+    """
+    with open(path) as f:
+        old = {(o['sieve'], o['n'], o['r'], o['q'], o['seed']): o for o in json.load(f)['results']}
+    for res in results:
+        o = old.get((res['sieve'], res['n'], res['r'], res['q'], res['seed']))
+        if o is not None and 'wall_time' in o and 'wall_time' in res:
+            print("%-10s n=%-4d r=%-4d q=%-6d seed=%-4d speedup %.2fx" % (res['sieve'], res['n'], res['r'], res['q'], res['seed'], o['wall_time'] / res['wall_time']))
+
+def grid_point(s):
+    """ Parses an 'n,r,q' triple """
+    n, r, q = (int(x) for x in s.split(','))
+    return (n, r, q)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the sieves on seeded Ajtai instances')
+    parser.add_argument('-grid', metavar='n,r,q', type=grid_point, nargs='+', default=[(20, 10, 61), (24, 12, 61)], help='Ajtai parameters to benchmark')
+    parser.add_argument('-sieves', nargs='+', choices=SIEVES, default=SIEVES, help='Sieves to run (default all)')
+    parser.add_argument('-seeds', metavar='seed', type=int, nargs='+', default=[0], help='Instance seeds (default 0)')
+    parser.add_argument('-N', metavar='N', type=int, default=None, help='Set size for nv and double (default 2^(0.208*d))')
+    parser.add_argument('-gamma', metavar='gamma', type=float, default=0.99, help='Reduction factor for nv and double (default 0.99)')
+    parser.add_argument('-c', metavar='c', type=int, default=10, help='Collisions for gauss (default 10)')
+    parser.add_argument('-workers', metavar='workers', type=int, default=0, help='Processes for double-par (default 0 = all cores)')
+    parser.add_argument('-out', metavar='file', default='bench.json', help='Result file (default bench.json)')
+    parser.add_argument('-compare', metavar='file', help='Earlier result file to compare wall times against')
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import tempfile
+import numpy as np
+
+def rng_state(rng):
+    """
+        Serializes the state of a numpy Generator to a JSON string
+    """
+    return json.dumps(rng.bit_generator.state)
+
+def restore_rng(state):
+    """
+        Builds a numpy Generator from a string made by rng_state()
+    """
+    state = json.loads(state)
+    bit_generator = getattr(np.random, state['bit_generator'])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+class Checkpoint:
+    """
+        Periodic checkpoints of a running sieve. The state is written as an
+        .npz file next to the target path and moved over it with os.replace(),
+        so an interrupted write never leaves a corrupt checkpoint behind.
+
+        Attributes:
+            path:       File the checkpoints are written to
+            interval:   Minimum number of seconds between two checkpoints
+            meta:       Arrays stored in every checkpoint, e.g. the sieve name,
+                        the basis and its parameters
+    """
+
+    def __init__(self, path, interval=600, **meta):
+        self.path = path
+        self.interval = interval
+        self.meta = meta
+        self._last = time.monotonic()
+
+    def due(self):
+        """ True if the last checkpoint is at least interval seconds old """
+        return time.monotonic() - self._last >= self.interval
+
+    def save(self, rng, iteration, **state):
+        """
+            Writes a checkpoint
+
+            Parameters:
+                rng:        The Generator driving the sieve
+                iteration:  Iteration (or loop) counter of the sieve
+                state:      Arrays describing the sieve state
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, rng=rng_state(rng), iteration=iteration, **self.meta, **state)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._last = time.monotonic()
+
+def load_checkpoint(path):
+    """
+        Reads a checkpoint written by Checkpoint.save()
+
+        Parameters:
+            path:   The checkpoint file
+
+        Returns:
+            state:  Dict with the stored arrays. Scalars are unwrapped to Python
+                    values and 'rng' is restored to a numpy Generator.
+    """
+    with np.load(path, allow_pickle=False) as f:
+        state = {k: (f[k].item() if f[k].ndim == 0 else f[k]) for k in f.files}
+    state['rng'] = restore_rng(state['rng'])
+    return state
@@ -1,108 +1,260 @@
 import numpy as np
-from numpy.linalg import norm
-from sample import sample_vec
+from contextlib import nullcontext
+from sample import GaussianSampler
+from sieve_db import SieveDatabase, sq_norm
+from metrics import Metrics
+from stopping import BestVector, StopPolicy
 
-def gauss_sieve(basis, c):
+def gauss_sieve(basis, c, rng=None, checkpoint=None, state=None, metrics=None, stages=None, params=None, sampler=None, stop=None,
+                workers=1, batch=None, backend=None):
     """
         The Gauss sieve. 
 
+        With stages set, the sieve runs progressively: new vectors are first
+        sampled from the sublattice spanned by the first k = stages[0] basis vectors,
+        and once c*k/d collisions are reached the next stage's larger sublattice
+        is used, keeping L and S, until the full lattice is sieved.
+        Basis vectors enter in column order, so the caller decides which
+        sublattices are sieved (sieve.py puts the q-ary vectors of a raw Ajtai
+        basis first, so that every stage is itself a smaller Ajtai lattice).
+
+        With more than one worker the sieve runs in batches, in the style of the
+        parallel Gauss sieves of Milde-Schneider and Ishiguro et al.: batch
+        candidates are taken from S (then the sampler) and reduced by the worker
+        processes against a snapshot of L, see parallel.ParallelReducer. The coordinator
+        then commits them one by one, re-reducing each against the vectors
+        inserted since the snapshot and applying the removals from L and the
+        pushes onto S itself, so L stays pairwise reduced. The result differs
+        from a serial run, since the candidates are processed in another order.
+
         Parameters:
-            basis:  Basis for the lattice we want to run the sieve on
-            c:      Number of collisions before we stop the sieve
+            basis:      Basis for the lattice we want to run the sieve on
+            c:          Number of collisions before we stop the sieve
+            rng:        Seed or numpy Generator for the sampler
+            checkpoint: Optional checkpoint.Checkpoint, written when due and on Ctrl+C
+            state:      Dict with L, S, K, iteration and buffer from a checkpoint, to resume a run
+            metrics:    Optional metrics.Metrics receiving a record every metrics.every loops
+            stages:     Increasing sublattice dimensions ending with d, for progressive sieving
+            params:     Ajtai parameters (n, r, q). Required when the basis has been
+                        reduced or reordered, otherwise read off its diagonal
+            sampler:    Sampler of fresh vectors, e.g. sample.KleinSampler. A
+                        sample.GaussianSampler over the basis by default
+            stop:       Optional stopping.StopPolicy, checked every loop; its
+                        collision budget counts the collisions of all stages
+            workers:    Number of reduction processes (1 = serial, 0 or None = all cores)
+            batch:      Candidates reduced per batch with several workers, 16 per
+                        worker by default
+            backend:    Kernel backend (see backend.py), NumPy by default
 
         Returns:
-            v:      Shortest vector found in the sieve
+            v:          Shortest vector found in the sieve
     """
     
     # Dimension of the lattice
     d = len(basis) 
     
     # Parameters from Ajtai generator
-    n = sum(1 for i in range(d) if basis[i][i] == 1)
-    r = d - n
-    q = int(basis[n][n])
+    if params is not None:
+        n, r, q = params
+    else:
+        n = sum(1 for i in range(d) if basis[i][i] == 1)
+        r = d - n
+        q = int(basis[n][n])
     
     # Compute and print the Minkowski bound
     minkowski_bound = (d**(0.5))*(q**r)**(1/d)
     print("Minkowski_bound = " + str(minkowski_bound))
     
-    L = []
-    S = []
+    stages = [d] if stages is None else list(stages)
+    if sampler is None:
+        sampler = GaussianSampler(basis, n, r, q, rng=rng)
+    metrics = metrics or Metrics()
+    stop = stop or StopPolicy()
+    best = BestVector()
+    L = SieveDatabase(d, dtype=basis.dtype)
+    S = SieveDatabase(d, dtype=basis.dtype)
     K = 0
+    it = 0
+    stage = 0
+    collisions = 0
+
+    # Pick up where a checkpointed run stopped
+    if state is not None:
+        L.extend(state['L'])
+        S.extend(state['S'])
+        K, it = state['K'], state['iteration']
+        stage = state.get('stage', 0)
+        best.offer_db(L)
+    start = it
+    sampler.restrict(stages[stage])
+    if state is not None:
+        sampler.restore(state['buffer'])
+
+    # Emits a metrics record for the current state
+    def record():
+        metrics.record('gauss', it, stage=stages[stage], size=len(L), stack=len(S), collisions=K, mean_norm=L.mean_norm(),
+                       min_norm=float(np.sqrt(L.sq_norms[0])) if len(L) else None)
+
+    # Writes the full sieve state to the checkpoint
+    def save():
+        checkpoint.save(sampler.rng, it, L=L.vectors, S=S.vectors, K=K, stage=stage, buffer=sampler.pending())
+
+    # Adds a reduced vector to L, or counts a collision if it is 0
+    def commit(v_new, sq):
+        nonlocal K, collisions
+        if sq == 0:
+            K += 1
+            collisions += 1
+        else:
+            L.insert_sorted(v_new, sq)
+            best.offer(v_new, sq)
+
+    # The process pool and shared memory are only set up for a parallel run
+    reducer = nullcontext()
+    if workers != 1:
+        from parallel import default_workers, ParallelReducer
+        workers = workers or default_workers()
+        if workers > 1:
+            reducer = ParallelReducer(d, L.dtype, workers, backend)
+    batch = batch or 16*workers
+    last = it // metrics.every
 
     # Since the sieve could run for a long time, we catch a Ctrl+C
     # and return the shortest vector found so far
     try:
-        # Run while we have fewer than c collisions
-        while K < c:
-            # Draw from the top of S if S is not empty, otherwise sample a new vector
-            v_new = S.pop() if len(S) else sample_vec(basis, 1, n, r, q)[0]
-            
-            # Reduce it
-            v_new = gauss_reduce(v_new, L, S)
-            
-            # If v_new is 0, we have a collision
-            if np.count_nonzero(v_new) == 0:
-                K += 1
-            else:
-                L.append(v_new)
-                print("\r Min norm in L: " + str(norm(min(L, key=lambda v: norm(v)))) , end="\r")
+        with reducer:
+            # Run while we have fewer than c collisions in the last stage
+            while (K < c or stage < len(stages) - 1) and not stop.done(best, it - start, collisions):
+                # Saturated the current sublattice, so move to the next larger one
+                if K >= max(1, c*stages[stage]//d):
+                    stage += 1
+                    sampler.restrict(stages[stage])
+                    K = 0
+
+                if workers == 1:
+                    # Draw from the top of S if S is not empty, otherwise sample a new vector
+                    with metrics.phase('sampling'):
+                        v_new = S.swap_remove(len(S) - 1) if len(S) else sampler.draw()
+
+                    # Reduce it
+                    with metrics.phase('reduction'):
+                        v_new = gauss_reduce(v_new, L, S, backend)
+                    commit(v_new, sq_norm(v_new))
+                    it += 1
+                else:
+                    # Take a batch from the top of S, topped up with new samples
+                    with metrics.phase('sampling'):
+                        P = [S.swap_remove(len(S) - 1) for _ in range(min(batch, len(S)))]
+                        P += [sampler.draw() for _ in range(batch - len(P))]
+
+                    # Reduce the batch in parallel, then commit it in order
+                    with metrics.phase('reduction'):
+                        P = reducer.reduce(P, L)
+                    with metrics.phase('commit'):
+                        fresh = SieveDatabase(d, dtype=L.dtype)
+                        for v_new in P:
+                            v_new, sq = reducer.commit(v_new, L, S, fresh)
+                            commit(v_new, sq)
+                    it += len(P)
+
+                if it // metrics.every > last:
+                    last = it // metrics.every
+                    record()
+
+                if checkpoint is not None and checkpoint.due():
+                    save()
     # Got Ctrl+C
     except KeyboardInterrupt:
+        if checkpoint is not None:
+            save()
         # Return the minimum so far
-        return min(L, key=lambda v: norm(v)).reshape(d)
+        return best.v
     
     # Return minimum once the loop ends
-    return min(S, key=lambda v: norm(v))
+    record()
+    return best.v
 
 
-def gauss_reduce(p, L, S):
+def gauss_reduce(p, L, S, backend=None):
     """
         Helper method in the gauss sieve algorithm. Takes a vector p
-        and reduces it using all the other vectors in L
+        and reduces it using all the other vectors in L, then reduces the
+        vectors of L that are longer than p by p.
+
+        L is kept sorted by squared norm, so the vectors shorter than p are a
+        prefix of L and the longer ones a suffix. A pair (p, v) is reducible,
+        i.e. one of p - v or p + v is shorter than the longer of p and v, exactly
+        when 2|<p, v>| > min(||p||, ||v||)^2, so each pass over L is a single
+        product of L with p. As in Gauss (Lagrange) reduction, the longer vector
+        is reduced by the nearest integer multiple round(<p, v>/||v||^2) of the
+        shorter one, so a long fresh sample is not shortened one step at a time.
 
         Parameters:
             p:  The vector to reduce
-            L:  The list of vectors to check against
+            L:  SieveDatabase of vectors to check against, sorted by norm
             S:  Stack of vectors to draw p from in the next step
+            backend: Kernel backend providing reduce_by(), NumPy by default
 
         Returns:
             p:  Reduced vector
     """
     
-    # Subroutine to check if we can find a smaller vector
-    def check_shorter_vec(p, L):
-        for v in L:
-            if np.count_nonzero(v) > 0:
-                if (norm(v) <= norm(p)) and (norm(p-v) <= norm(p)):
-                    return (True, v)
-        return (False, -1)
-    
-    shorter_found = True
-    # Loop until a smaller vector exists and reduce p by it
-    while shorter_found:
-        shorter_found, v = check_shorter_vec(p, L)
-        if shorter_found: 
-            p -= v
-
-    # L_indices stores the indices of v_i's that match the condition below
-    L_indices = []
-    
-    # When deleting elements from a list, all the indices shift to the left after each operation,
-    # so we use a counter to account for that offset
-    ct = 0
-
-    # Loop over L and see if we can find v_i such that ||v_i|| > ||p||
-    # and ||v_i - p|| <= ||v_i||
-    for i in range(len(L)):
-        v = L[i]
-        if (norm(v) > norm(p)) and (norm(v - p) <= norm(v)):
-            L_indices.append(i - ct)
-            ct += 1
-    
-    # Remove matched v_i's from the list and append v_i - p to S
-    for i in L_indices:
-        v = L.pop(i)
-        S.append(v - p)
-
+    p, p_sq = (reduce_by if backend is None else backend.reduce_by)(p, L.vectors, L.sq_norms)
+    if p_sq == 0:
+        return p
+    reduce_longer(p, p_sq, L, S)
     return p
+
+def reduce_by(p, V, sq):
+    """
+        First half of gauss_reduce(). Reduces p in place by the vectors of V
+        that are shorter than it, until none of them reduces it.
+
+        Parameters:
+            p:  The vector to reduce
+            V:  Matrix of vectors sorted by norm
+            sq: Their squared norms
+
+        Returns:
+            p:      Reduced vector
+            p_sq:   Its squared norm
+    """
+    p_sq = sq_norm(p)
+    # Loop while p can be reduced by one of the shorter vectors, always
+    # using the one that gives the shortest result
+    while True:
+        k = int(np.searchsorted(sq, p_sq, side='right'))
+        if k == 0:
+            break
+        ip = V[:k] @ p
+        m = np.rint(ip / sq[:k])
+        gain = m*(2*ip - m*sq[:k])
+        i = int(np.argmax(gain))
+        if gain[i] <= 0:
+            break
+        p -= int(m[i])*V[i]
+        p_sq = sq_norm(p)
+    return p, p_sq
+
+def reduce_longer(p, p_sq, L, S):
+    """
+        Second half of gauss_reduce(). Reduces every vector of L longer than p
+        by p, moving the ones that change from L onto S.
+
+        Parameters:
+            p:      A non-zero vector, reduced by the shorter vectors of L
+            p_sq:   Its squared norm
+            L:      SieveDatabase sorted by norm
+            S:      Stack that receives the reduced vectors
+    """
+    # Find every v_i in L with ||v_i|| > ||p|| that p reduces
+    k = int(np.searchsorted(L.sq_norms, p_sq, side='right'))
+    m = np.rint((L.vectors[k:] @ p) / p_sq).astype(L.dtype)
+    matched = np.zeros(len(L), dtype=bool)
+    matched[k:] = m != 0
+    
+    # Push v_i - m_i p onto S and remove the matched v_i's from L in one pass
+    if matched.any():
+        V = L.vectors[matched] - m[m != 0][:, None]*p
+        S.extend(V)
+        L.compact(~matched)
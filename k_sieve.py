@@ -1,211 +1,363 @@
+import os
 import numpy as np
-from numpy.linalg import norm
-from multiprocessing import Pool
-from itertools import combinations
-from math import comb
-from random import randint, sample
-from utils import remove_zeros, par_remove_zeros
-
-def double_sieve(S, gamma, minkowski_bound):
+from math import gcd, isqrt
+from numpy.random import default_rng
+from sieve_db import SieveDatabase, Reservoir
+from pair_search import reducible_pairs
+from triple_search import reducible_triples
+from lsh import lsh_reducible_pairs
+from metrics import Metrics
+from schedule import Schedule
+from stopping import BestVector, StopPolicy
+
+def double_sieve(S, gamma, minkowski_bound, tile=512, workers=1, lsh=None, rng=None, checkpoint=None, start=0, metrics=None,
+                 stages=None, sampler=None, stage=0, dedup=False, schedule=None, stop=None, compact=False,
+                 k=2, alpha=0.3, mmap=None, backend=None, size=None):
     """
         The double sieve. This method iteratively calls the sieve step until we have no
-        more vectors to reduce or we reach the Minkowski bound. Vectors in the sieve
+        more vectors to reduce or the stopping policy says so, by default once a vector
+        below the Minkowski bound is found. Vectors in the sieve
         are reduced at each step based on the condition: 
         For v, w in S, 
             Promote v +- w if norm(v +- w) <= gamma * R
         for appropriate gamma and R
 
+        With stages set, the sieve runs progressively: S is drawn from the sublattice of the
+        first stages[stage] basis vectors, and whenever fewer than N pairs are reducible (the
+        set can no longer be refilled) the sampler moves to the next stage's sublattice and
+        the set is topped up to N with fresh vectors from it. The sieved vectors of one stage
+        thus seed the next one.
+
+        A schedule.Schedule sets gamma for every iteration. When it has a target size N,
+        the set is topped up to N from the sampler after every iteration, so it cannot
+        collapse.
+
+        With k = 3 the sieve is a triple sieve: every iteration also promotes the reducible
+        triples v -+ w -+ u, see lattice_sieve_three(). Triples find short vectors with a set
+        of about 2^(0.189d) vectors instead of 2^(0.208d), at the cost of more time.
+
+        With mmap set, the set is kept in a memory-mapped file instead of RAM (see
+        sieve_db.SieveDatabase). Every iteration writes the next set to mmap + '.next',
+        which replaces the file at mmap at the end of the iteration, so the file holds the
+        last set when the sieve returns. The file of an iteration that does not finish is removed.
+
         Parameters:
             S:                  The original set
-            gamma:              The reduction factor
-            minkowski_bound:    Upper bound on size of shortest vector
+            gamma:              The reduction factor, unless a schedule is given
+            minkowski_bound:    Upper bound on size of shortest vector, the target norm
+                                when no stopping policy is given
+            tile:               Tile size of the blocked pair search
+            workers:            Number of processes for the pair search (1 = serial)
+            lsh:                (tables, bits) to search pairs with angular LSH, None for all pairs
+            rng:                Seed or numpy Generator
+            checkpoint:         Optional checkpoint.Checkpoint, written when due and on Ctrl+C
+            start:              Number of iterations already done, when resuming from a checkpoint
+            metrics:            Optional metrics.Metrics receiving one record per iteration
+            stages:             Increasing sublattice dimensions ending with d, for progressive sieving
+            sampler:            Sampler (see sample.py) used to top up the set
+            stage:              Index of the current stage, when resuming from a checkpoint
+            dedup:              Drop duplicates and negations from the set of every iteration
+            schedule:           Optional schedule.Schedule, a fixed gamma by default
+            stop:               Optional stopping.StopPolicy
+            compact:            Store the set in the narrowest integer dtype that fits and
+                                prefilter the pairs in float32, see lattice_sieve_two()
+            k:                  Tuple size, 2 for pairs or 3 for pairs and triples
+            alpha:              Minimum |cos| of the pairs extended to triples when k = 3
+            mmap:               The .npy file holding the set, None to keep it in RAM
+            backend:            Kernel backend of the exhaustive pair search (see backend.py),
+                                NumPy by default
+            size:               Size the set is refilled to when moving to the next stage,
+                                len(S) by default; the original size when resuming
 
         Returns:
-            v:                  Vector with norm less than minkowski bound.
+            v:                  The shortest vector found, below the target norm
+                                unless the sieve ran out of vectors or budget
 
     """
-    S_0 = S
-    marked_list = []
-    avg_list = []
+    S = SieveDatabase.from_vectors(S, narrow=compact, path=mmap)
+    rng = default_rng(rng)
+    metrics = metrics or Metrics()
+    schedule = schedule or Schedule(gamma)
+    stop = stop or StopPolicy(minkowski_bound)
+    nxt = None if mmap is None else mmap + '.next'
+    best = BestVector()
+    best.offer_db(S)
+    it = start
+    N = len(S) if size is None else size
+    last = 0 if stages is None else len(stages) - 1
     
-    # Run sieve until we run out of vectors
-    while len(S) > 0:
-        S_0 = S
-        # Run a sieve step and get the set for the next step
-        S, marked, avg_length = lattice_sieve_two(S, gamma)
-        
-        #S = lattice_sieve(S, gamma)
-
-        # Keep track of the number of reducible pairs at each step
-        marked_list.append(marked)
-        avg_list.append(avg_length)
-
-        # Print the min norm at the current step
-        if len(S):
-            min_norm = norm(min(S, key=lambda v: norm(v)))
-            print("\r" + str(len(S)) + ", Min norm in S: " + str(min_norm), end="\r")
-            
-            # If the min norm is less than the upper bound, we can stop
-            if min_norm < minkowski_bound:
-                print(marked_list)
-                print(avg_list)
-                return min(S, key=lambda v: norm(v))
+    # Since the sieve could run for a long time, we catch a Ctrl+C, save
+    # a checkpoint and return the shortest vector found so far
+    try:
+        # Run sieve until we run out of vectors or budget
+        while len(S) > 0 and not stop.done(best, it - start):
+            S_0 = S
+            # Run a sieve step and get the set for the next step
+            gamma = schedule.gamma
+            if k == 3:
+                S_p, marked, avg_length = lattice_sieve_three(S, gamma, alpha, tile, workers, lsh, rng, metrics, dedup, compact, nxt,
+                                                                backend)
+            else:
+                S_p, marked, avg_length = lattice_sieve_two(S, gamma, tile, workers, lsh, rng, metrics, dedup, compact, nxt, backend)
+            if mmap is not None:
+                S_p.move(mmap)
+            duplicates = S_p.index.rejected if dedup else 0
+            S, it = S_p, it + 1
+            best.offer_db(S)
+            schedule.update(marked / len(S_0), S.mean_norm() / S_0.mean_norm() if len(S) else 0.0)
+
+            # The current sublattice is saturated, so move to the next larger one
+            if len(S) < N and stage < last:
+                stage += 1
+                sampler.restrict(stages[stage])
+                with metrics.phase('sampling'):
+                    sampler.fill(S, N - len(S))
+
+            # Keep the set at the size the schedule asks for
+            if schedule.N is not None and sampler is not None and len(S) < schedule.N:
+                with metrics.phase('sampling'):
+                    sampler.fill(S, schedule.N - len(S))
+
+            # Keep track of the number of reducible pairs at each step
+            min_norm = float(np.sqrt(S.sq_norms.min(initial=np.inf)))
+            metrics.record('double', it, stage=stages[stage] if stages else S.d, gamma=gamma, size=len(S), marked=marked, avg_length=avg_length,
+                           duplicates=duplicates, dedup_rate=duplicates / marked if marked else 0.0, mean_norm=S.mean_norm(), min_norm=min_norm)
+
+            if len(S):
+                if checkpoint is not None and checkpoint.due():
+                    checkpoint.save(rng, it, S=S.vectors, stage=stage, size=N, gamma=schedule.gamma, target=schedule.N or 0)
+    except KeyboardInterrupt:
+        if checkpoint is not None and len(S):
+            checkpoint.save(rng, it, S=S.vectors, stage=stage, size=N, gamma=schedule.gamma, target=schedule.N or 0)
+    finally:
+        # A step that did not finish leaves its next set behind
+        if nxt is not None and os.path.exists(nxt):
+            os.remove(nxt)
             
-    # Return the vector we found
-    
-    print(marked_list)
-    print(avg_list)
-    return min(S_0, key=lambda v: norm(v))
+    # Return the shortest vector we found
+    return best.v
 
-def lattice_sieve(S, gamma):
+def lattice_sieve(S, gamma, rng=None):
     """
         One step of the sieve. The loop in this method only runs until we have enough
-        vectors ~ 2^(0.415d) for the next step of the sieve.
+        vectors ~ 2^(0.415d) for the next step of the sieve, or every pair has been tried.
 
         Parameters:
-            S:      The starting set of vectors
+            S:      The starting set of vectors as a SieveDatabase
             gamma:  The reduction factor, typically 0.99
+            rng:    Seed or numpy Generator for the order of the pairs
 
         Returns:
-            S_p:    The set for the next step of the sieve
+            S_p:    The set for the next step of the sieve as a SieveDatabase
     """
     
     # Start with an empty sieve and compute R as the mean norm of the vectors in 
     # the input set
-    S_p = []
-    #R = norm(max(S, key=lambda x: norm(x)))
-    R = sum(norm(v) for v in S)/len(S)
+    S = SieveDatabase.from_vectors(S)
+    S_p = SieveDatabase(S.d, capacity=len(S), dtype=S.dtype)
+    R = S.mean_norm()
     gR = gamma*R
+    gR2 = gR*gR
     N = len(S)
     
     # Counter for the number of vectors that make it through the sieve
     num_next_sieve = 0
     
-    # Set to keep track of which pairs of vectors we have already looked at
-    already_generated = set()
-    # Function that generates random indices
-    gen_indices = lambda: (randint(0, N-1), randint(0, N-1))
-    
-    # Main sieving loop that runs until we have enough vectors in the sieve
-    while num_next_sieve < N:
-        # Generate random indices to look at
-        new = False
-        while not new:
-            i, j = gen_indices()
-            if i != j and (i, j) not in already_generated:
-                new = True
-                already_generated.add((i, j))
-                already_generated.add((j, i))
-        
+    # Main sieving loop that runs until we have enough vectors in the sieve.
+    # The pairs come in random order without repeats, and without a set of
+    # the pairs already looked at
+    for i, j in random_pairs(N, rng):
+        if num_next_sieve >= N:
+            break
         # See if we can reduce this pair of vectors
-        v, w = S[i], S[j]
-        if np.count_nonzero(v - w) and norm(v - w) <= gR:
-            S_p.append(v - w)
-            num_next_sieve += 1
-        elif np.count_nonzero(v + w) and norm(v + w) <= gR:
-            S_p.append(v + w)
-            num_next_sieve += 1
+        num_next_sieve += _reduce_pair(S, i, j, gR2, S_p)
     
     # Return our new set
     return S_p
 
-def lattice_sieve_two(S, gamma):
+def random_pairs(N, rng=None):
+    """
+        Generates every pair (i, j), i < j < N, exactly once in a pseudo-random
+        order using O(1) memory. Pair number c in the row-by-row enumeration
+        c = j(j-1)/2 + i is visited at step (c - b)/a mod N(N-1)/2 for random
+        a coprime to the number of pairs and random b.
+
+        Parameters:
+            N:      Number of vectors
+            rng:    Seed or numpy Generator
+
+        Returns:
+            A generator of index pairs
+    """
+    rng = default_rng(rng)
+    M = N*(N-1)//2
+    if M == 0:
+        return
+    a = int(rng.integers(1, M + 1))
+    while gcd(a, M) != 1:
+        a = int(rng.integers(1, M + 1))
+    b = int(rng.integers(M))
+    for t in range(M):
+        c = (a*t + b) % M
+        j = (1 + isqrt(8*c + 1))//2
+        yield c - j*(j-1)//2, j
+
+def lattice_sieve_two(S, gamma, tile=512, workers=1, lsh=None, rng=None, metrics=None, dedup=False, compact=False, path=None,
+                      backend=None):
     """
         One step of the sieve. This method is the same as lattice_sieve(), except we don't stop the
         loop once we have enough vectors. This is used for instrumentation. We do truncate the sieve
         to size ~2^(0.415d), however we let the loop run in order to compute the number of pairs
-        that are reducible at each sieve step.
+        that are reducible at each sieve step. The pairs are searched tile by tile with
+        pair_search.reducible_pairs() and the reduced vectors are streamed into a reservoir
+        of N vectors (sieve_db.Reservoir), so memory stays O(N + tile^2) however many pairs
+        are reducible, while marked and avg_length still cover all of them. With more
+        than one worker the tiles are spread over a process pool. With lsh set, only the pairs
+        that collide in an angular LSH table are tested (see lsh.lsh_reducible_pairs()), so
+        marked and avg_length then count the reducible pairs that were found. With dedup set,
+        reduced vectors equal to an earlier one up to sign are dropped before the reservoir;
+        they still count as marked, and avg_length is over the distinct vectors. With compact
+        set, the next set is stored in the narrowest integer dtype that fits it (see
+        sieve_db.SieveDatabase) and the exhaustive pair search tests every tile in float32
+        before verifying the candidates exactly, with the same result. With path set, the
+        next set is memory-mapped to that file.
 
         Parameters:
-            S:              The starting set of vectors
+            S:              The starting set of vectors as a SieveDatabase
             gamma:          The reduction factor, typically 0.99
+            tile:           Tile size of the blocked pair search
+            workers:        Number of processes for the pair search (1 = serial, None = all cores)
+            lsh:            (tables, bits) to search pairs with angular LSH, None for all pairs
+            rng:            Seed or numpy Generator
+            metrics:        Optional metrics.Metrics timing the pair_search phase
+            dedup:          Drop duplicates and negations of reduced vectors
+            compact:        Narrow storage and float32 prefilter
+            path:           File for the next set, None to keep it in RAM
+            backend:        Kernel backend of the exhaustive pair search, NumPy by default
 
         Returns:
-            S_p:            The set for the next step of the sieve
+            S_p:            The set for the next step of the sieve as a SieveDatabase
             num_next_sieve: The number of pairs that were reducible in the previous set
+            avg_length:     The mean norm of all the reduced vectors
     """
     
     # Start with an empty sieve and compute R as the mean norm of the vectors in 
     # the input set
-    S_p = []
-    R = sum(norm(v) for v in S)/len(S)
+    S = SieveDatabase.from_vectors(S)
+    rng = default_rng(rng)
+    metrics = metrics or Metrics()
+    R = S.mean_norm()
     gR = gamma*R
     N = len(S)
+
+    # Only N vectors are promoted to the next step, a uniform sample of all
+    # the reduced ones
+    S_p = Reservoir(S.d, N, dtype=S.dtype, rng=rng, dedup=dedup, narrow=compact, path=path)
     
-    # Counter for the number of pairs that make it to the next step
-    num_next_sieve = 0
-    
-    # Loop over all combinations of vectors and reduce
-    for i, j in combinations(range(N), 2):
-        v, w = S[i], S[j]
-        if np.count_nonzero(v - w) and norm(v - w) <= gR:
-            S_p.append(v - w)
-            num_next_sieve += 1
-        elif np.count_nonzero(v + w) and norm(v + w) <= gR:
-            S_p.append(v + w)
-            num_next_sieve += 1
-    
-    # Only promote N vectors to the next step
-    avg_length = sum(norm(v) for v in S_p)/len(S_p)
-    return sample(S_p, N), num_next_sieve, avg_length
+    # Loop over all tiles of pairs and collect the reduced vectors in bulk
+    with metrics.phase('pair_search'):
+        for V, sq in _pair_source(S, gR, tile, workers, lsh, rng, compact, backend):
+            S_p.offer(V, sq)
+    marked = S_p.seen + (S_p.index.rejected if dedup else 0)
+    return S_p, marked, S_p.stream_mean_norm()
 
-def run_loop(S, gR, i, j):
+def lattice_sieve_three(S, gamma, alpha=0.3, tile=512, workers=1, lsh=None, rng=None, metrics=None, dedup=False, compact=False,
+                        path=None, backend=None):
     """
-        Helper method for parallel execution of the double sieve
-        Checks if the two given vectors can be reduced
+        One step of the triple sieve. This is lattice_sieve_two() followed by a search for the
+        reducible triples v -+ w -+ u of norm at most gamma * R, and both the reduced pairs and
+        the reduced triples are streamed into the same reservoir of N vectors. Only the pairs
+        (v, w) with |cos(v, w)| >= alpha are extended to triples, using the Gram matrix, see
+        triple_search.reducible_triples(). The triple search is always exhaustive and serial;
+        lsh, workers and compact only apply to the pairs.
 
         Parameters:
-            S:              Set of vectors
-            gR:             Reduction factor
-            i:              First index for pair
-            j:              Second index for pair
+            S:              The starting set of vectors as a SieveDatabase
+            gamma:          The reduction factor, typically 0.99
+            alpha:          Minimum |cos| of the pairs that are extended to triples
+            tile:           Tile size of the pair and triple search
+            workers:        Number of processes for the pair search (1 = serial, None = all cores)
+            lsh:            (tables, bits) to search pairs with angular LSH, None for all pairs
+            rng:            Seed or numpy Generator
+            metrics:        Optional metrics.Metrics timing the pair_search and triple_search phases
+            dedup:          Drop duplicates and negations of reduced vectors
+            compact:        Narrow storage and float32 prefilter of the pairs
+            path:           File for the next set, None to keep it in RAM
+            backend:        Kernel backend of the exhaustive pair search, NumPy by default
 
         Returns:
-            v +- w or None: The reduced pair, or None
+            S_p:            The set for the next step of the sieve as a SieveDatabase
+            marked:         The number of pairs and triples that were reducible in the previous set
+            avg_length:     The mean norm of all the reduced vectors
     """
-    # Get the pair
-    v, w  = S[i], S[j]
-    
-    # Check if they can be reduced and return appropriate 
-    # sum or difference
-    if norm(v - w) <= gR:
-        return v - w
-    elif norm(v + w) <= gR:
-        return v + w
-
-def parallel_lattice_sieve(S, gamma):
+    S = SieveDatabase.from_vectors(S)
+    rng = default_rng(rng)
+    metrics = metrics or Metrics()
+    gR = gamma*S.mean_norm()
+    S_p = Reservoir(S.d, len(S), dtype=S.dtype, rng=rng, dedup=dedup, narrow=compact, path=path)
+
+    with metrics.phase('pair_search'):
+        for V, sq in _pair_source(S, gR, tile, workers, lsh, rng, compact, backend):
+            S_p.offer(V, sq)
+    with metrics.phase('triple_search'):
+        for V, sq in reducible_triples(S, gR, alpha, tile):
+            S_p.offer(V, sq)
+    marked = S_p.seen + (S_p.index.rejected if dedup else 0)
+    return S_p, marked, S_p.stream_mean_norm()
+
+def _pair_source(S, gR, tile, workers, lsh, rng, compact, backend):
+    # The reduced vectors of all the reducible pairs, from the LSH, the serial
+    # or the parallel pair search
+    if lsh is not None:
+        return lsh_reducible_pairs(S, gR, *lsh, rng=rng)
+    if workers == 1:
+        return reducible_pairs(S, gR, tile, compact, backend)
+    from parallel import parallel_reducible_pairs
+    return parallel_reducible_pairs(S, gR, tile, workers, compact, backend)
+
+def _reduce_pair(S, i, j, gR2, S_p):
     """
-        Method for parallel execution of the double sieve
+        Checks if v - w or v + w is a non-zero vector of squared norm at most gR2
+        for v = S[i], w = S[j], and appends it to S_p if so. The cached squared
+        norms of S are used, so only the inner product has to be computed:
+        |v -+ w|^2 = |v|^2 + |w|^2 -+ 2<v, w>
 
         Parameters:
-            S:      Set of vectors
-            gamma:  Reduction factor
+            S:      Database holding the pair
+            i:      First index for pair
+            j:      Second index for pair
+            gR2:    Squared reduction bound (gamma * R)^2
+            S_p:    Database that receives the reduced vector
 
         Returns:
-            S_p:    The next sieve set
-            marked: Number of pairs from previous set that were reduced
+            1 if the pair was reduced, else 0
     """
-    # Start with empty set
-    S_p = []
-    
-    # Compute the value of R as the mean of the vectors in S
-    R = sum(norm(v) for v in S)/len(S)
-    gR = gamma*R
-    N = len(S)
+    v, w = S[i], S[j]
+    base = S.sq_norms[i] + S.sq_norms[j]
+    ip = 2*float(np.dot(v, w))
+    if base - ip <= gR2 and np.any(v != w):
+        S_p.append(v - w, base - ip)
+        return 1
+    if base + ip <= gR2 and np.any(v != -w):
+        S_p.append(v + w, base + ip)
+        return 1
+    return 0
 
-    # Number of combinations to try
-    num_repeat = comb(N, 2)
+def parallel_lattice_sieve(S, gamma, tile=512, workers=None):
+    """
+        Method for parallel execution of the double sieve. The set is put in
+        shared memory and the workers reduce whole tiles of pairs, see
+        parallel.parallel_reducible_pairs()
 
-    # Start a pool of 16 processes since we have 16 pprocessors
-    with Pool(16) as p:
-        # Get the results in an array
-        S_p = p.starmap(run_loop, [(S, gR, i, j) for i, j in combinations(range(N), 2)])
+        Parameters:
+            S:          Set of vectors
+            gamma:      Reduction factor
+            tile:       Tile size of the pair search
+            workers:    Number of worker processes, all cores by default
 
-    # The retured list might have None values and zero vectors, so remove them
-    S_p = par_remove_zeros(S_p)
-    
-    # Get the number of reduced vectors
-    marked = len(S_p)
-    
-    # Randomly pick N vectors to move to the next step of the sieve and return
-    return sample(S_p, N), marked
+        Returns:
+            S_p:        The next sieve set as a SieveDatabase
+            marked:     Number of pairs from previous set that were reduced
+    """
+    S_p, marked, _ = lattice_sieve_two(S, gamma, tile, workers)
+    return S_p, marked
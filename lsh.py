@@ -0,0 +1,124 @@
+import numpy as np
+from numpy.random import default_rng
+from pair_search import tile_pairs, combine
+
+class AngularLSH:
+    """
+        Near-neighbour index based on random hyperplane hashing (SimHash), as
+        used by the HashSieve. Each of the tables hashes a vector to the sign
+        pattern of its inner products with bits random hyperplanes, so vectors
+        at a small angle tend to land in the same bucket. Since -v gets the
+        complemented hash of v, vectors at an angle close to pi (candidates for
+        v + w) are found in the complement bucket.
+
+        Attributes:
+            tables: Number of hash tables
+            bits:   Number of hyperplanes (hash bits) per table
+    """
+
+    def __init__(self, d, tables=4, bits=8, rng=None):
+        self.tables = tables
+        self.bits = bits
+        self.planes = default_rng(rng).standard_normal((tables, d, bits))
+        self.mask = (1 << bits) - 1
+        self._weights = 1 << np.arange(bits, dtype=np.int64)
+        self._buckets = [{} for _ in range(tables)]
+
+    def hashes(self, V):
+        """
+            Hashes a block of vectors in every table
+
+            Parameters:
+                V:  Matrix of vectors (rows) or a single vector
+
+            Returns:
+                H:  (tables, m) array of bucket keys, or (tables,) for a single vector
+        """
+        V = np.asarray(V, dtype=np.float64)
+        return (np.einsum('...d,tdb->t...b', V, self.planes) > 0) @ self._weights
+
+    def insert(self, i, v):
+        """
+            Adds the vector v with identifier i to every table
+        """
+        for table, key in zip(self._buckets, self.hashes(v)):
+            table.setdefault(int(key), []).append(i)
+
+    def candidates(self, v, negated=False):
+        """
+            Identifiers of the stored vectors colliding with v in at least one table
+
+            Parameters:
+                v:          The query vector
+                negated:    Also look in the buckets of -v
+
+            Returns:
+                ids:        Sorted array of identifiers
+        """
+        ids = []
+        for table, key in zip(self._buckets, self.hashes(v)):
+            ids.extend(table.get(int(key), ()))
+            if negated:
+                ids.extend(table.get(int(key) ^ self.mask, ()))
+        return np.unique(np.asarray(ids, dtype=np.intp))
+
+def buckets(keys):
+    """
+        Groups the row indices of a set by their hash key in one table
+
+        Parameters:
+            keys:   Bucket key of every row
+
+        Returns:
+            groups: Dict mapping each key to the sorted array of its rows
+    """
+    order = np.argsort(keys, kind='stable')
+    uniq, start = np.unique(keys[order], return_index=True)
+    return dict(zip(uniq.tolist(), np.split(order, start[1:])))
+
+def lsh_reducible_pairs(S, gR, tables=4, bits=8, tile=4096, rng=None):
+    """
+        Approximate version of pair_search.reducible_pairs(). Only pairs that
+        share a bucket (candidates for v - w) or sit in complementary buckets
+        (candidates for v + w) in at least one table are tested, so the work
+        is about N^2 / 2^bits per table instead of N^2. Pairs found in several
+        tables are reported once.
+
+        Parameters:
+            S:      SieveDatabase to search
+            gR:     Reduction bound (gamma * R)
+            tables: Number of hash tables
+            bits:   Number of hash bits per table
+            tile:   Maximum number of reduced vectors built at once
+            rng:    Seed or numpy Generator for the hyperplanes
+
+        Yields:
+            V, sq:  A block of reduced vectors and their squared norms
+    """
+    N = len(S)
+    X, sq = S.vectors, S.sq_norms
+    gR2 = gR*gR
+    lsh = AngularLSH(S.d, tables, bits, rng)
+    found = []
+
+    for keys in lsh.hashes(X):
+        groups = buckets(keys)
+        for key, I in groups.items():
+            # Pairs inside the bucket, then pairs with the complement bucket
+            J = groups.get(key ^ lsh.mask)
+            blocks = [(I, True)] + ([(J, False)] if J is not None and key < key ^ lsh.mask else [])
+            for J, diagonal in blocks:
+                ia, ib, sign = tile_pairs(X[I], sq[I], X[J], sq[J], gR2, diagonal)
+                a, b = I[ia], J[ib]
+                # Orient every pair as (min, max) so duplicates across tables collide
+                lo, hi = np.minimum(a, b), np.maximum(a, b)
+                found.append((lo.astype(np.int64)*N + hi)*2 + (sign > 0))
+
+    if not found:
+        return
+    codes = np.unique(np.concatenate(found))
+    for k in range(0, len(codes), tile):
+        c = codes[k:k+tile]
+        pair, plus = c // 2, c % 2
+        V, v_sq = combine(X, pair // N, X, pair % N, np.where(plus, 1, -1).astype(np.int8))
+        yield V, v_sq
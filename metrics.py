@@ -0,0 +1,135 @@
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss():
+    """ Peak resident set size of this process in kB, or None if unknown """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Phases timed by the sieves. Every record has a time_ column for each of them,
+# so that all records of a run share one CSV header.
+PHASES = ('sampling', 'reduction', 'commit', 'sieve', 'zero_removal', 'pair_search', 'triple_search')
+
+class Metrics:
+    """
+        Per-iteration instrumentation for the sieves. Each sieve times its
+        phases with phase() and calls record() once per iteration (every
+        `every` loops for the Gauss sieve) with its counters. A record is a
+        flat dict that gets the accumulated phase times, the wall time since
+        the start and the peak RSS added, and is then written to a JSON Lines
+        or CSV file (chosen by the file extension) and/or passed to a callback.
+        One-off records, such as basis preprocessing, go through summary().
+
+        Attributes:
+            path:       Output file, .csv for CSV and anything else for JSON Lines
+            callback:   Function called with every record
+            progress:   Print a one-line progress report with carriage returns
+            every:      Stride, in loop iterations, for sieves that record per loop
+    """
+
+    def __init__(self, path=None, callback=None, progress=False, every=1000):
+        self.path = path
+        self.callback = callback
+        self.progress = progress
+        self.every = every
+        self._phases = {}
+        self._start = time.perf_counter()
+        self._file = None
+        self._writer = None
+
+    @contextmanager
+    def phase(self, name):
+        """
+            Adds the time spent in the with-block to the phase `name`
+        """
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = self._phases.get(name, 0.0) + time.perf_counter() - t
+
+    def record(self, sieve, iteration, **fields):
+        """
+            Emits one record and resets the phase timers
+
+            Parameters:
+                sieve:      Name of the sieve
+                iteration:  Iteration counter
+                fields:     Counters of the iteration, e.g. size, marked, min_norm
+
+            Returns:
+                row:        The record
+        """
+        row = self._row({'sieve': sieve, 'iteration': iteration, **fields}, PHASES)
+        if self.path is not None:
+            self._write(row)
+        if self.callback is not None:
+            self.callback(row)
+        if self.progress:
+            print("\r" + str(iteration) + ": size " + str(fields.get('size')) + ", min norm " + str(fields.get('min_norm')), end="\r")
+        return row
+
+    def summary(self, name, **fields):
+        """
+            Emits a one-off record, e.g. the preprocessing before the sieve,
+            and resets the phase timers. It is written to the JSON Lines file
+            like a record; next to a CSV file, whose columns are fixed by the
+            per-iteration records, it goes to <name of the CSV file>.<name>.jsonl.
+
+            Parameters:
+                name:       Name of the record
+                fields:     Its values, e.g. the preprocessing statistics
+
+            Returns:
+                row:        The record
+        """
+        row = self._row({'summary': name, **fields}, ())
+        if self.path is not None:
+            if self.path.endswith('.csv'):
+                with open(self.path[:-len('.csv')] + '.' + name + '.jsonl', 'w') as f:
+                    f.write(json.dumps(row, default=lambda x: x.item()) + "\n")
+            else:
+                self._write(row)
+        if self.callback is not None:
+            self.callback(row)
+        return row
+
+    def _row(self, row, phases):
+        # Adds the phase times (0 for the given phases that did not run), the
+        # wall time and the peak RSS to a record
+        for name in phases:
+            row['time_' + name] = self._phases.get(name, 0.0)
+        for name, t in self._phases.items():
+            row.setdefault('time_' + name, t)
+        row['wall_time'] = time.perf_counter() - self._start
+        row['peak_rss_kb'] = peak_rss()
+        self._phases = {}
+        return row
+
+    def _write(self, row):
+        # Open the file lazily, so that the CSV header can be taken from the
+        # first record. All records of a sieve have the same fields.
+        if self._file is None:
+            self._file = open(self.path, 'w', newline='')
+        if self.path.endswith('.csv') and self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(row), restval='', extrasaction='ignore')
+            self._writer.writeheader()
+        if self._writer is not None:
+            self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(row, default=lambda x: x.item()) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """ Closes the output file """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,83 +1,193 @@
+import os
 import numpy as np
-from numpy.linalg import norm
-from utils import remove_zeros
+from numpy.random import default_rng
+from sieve_db import SieveDatabase, sq_norms
+from lsh import AngularLSH
+from utils import filter_vectors
+from schedule import Schedule
+from stopping import BestVector, StopPolicy
+from metrics import Metrics
 
-def nguyen_vidick_sieve(S, gamma):
+def nguyen_vidick_sieve(S, gamma, lsh=None, rng=None, checkpoint=None, start=0, metrics=None, dedup=False,
+                        sampler=None, schedule=None, stop=None, mmap=None, backend=None):
     """
         Runs the NV sieve.
 
+        A schedule.Schedule sets gamma for every iteration. When it has a target size N,
+        the set is topped up to N from the sampler after every iteration, so it cannot
+        run empty and the run ends when the stopping policy says so.
+
+        With mmap set, the set is kept in a memory-mapped file instead of RAM (see
+        sieve_db.SieveDatabase). Every iteration writes the next set to mmap + '.next',
+        which replaces the file at mmap at the end of the iteration. The file of an iteration
+        that does not finish is removed.
+
         Parameters:
-            S:      The initial set of lattice points
-            gamma:  The norm reduction factor
+            S:          The initial set of lattice points (list, array or SieveDatabase)
+            gamma:      The norm reduction factor, unless a schedule is given
+            lsh:        (tables, bits) to look up centers with angular LSH, None for a full scan
+            rng:        Seed or numpy Generator
+            checkpoint: Optional checkpoint.Checkpoint, written when due and on Ctrl+C
+            start:      Number of iterations already done, when resuming from a checkpoint
+            metrics:    Optional metrics.Metrics receiving one record per iteration
+            dedup:      Drop duplicates and negations from the set of every iteration
+            sampler:    Sampler (see sample.py) used to top up the set
+            schedule:   Optional schedule.Schedule, a fixed gamma by default
+            stop:       Optional stopping.StopPolicy, zeros count as collisions
+            mmap:       The .npy file holding the set, None to keep it in RAM
+            backend:    Kernel backend (see backend.py), NumPy by default
 
         Returns:
-            v:      The shortest vector found by the sieve
+            v:          The shortest vector found by the sieve
     """
     
-    S_0 = S
-    while len(S) > 0:
-        S_0 = S
-        S = lattice_sieve(S, gamma)
-        S = remove_zeros(S)
-        if len(S):
-            print("\r Min norm in S: " + str(norm(min(S, key=lambda v: norm(v)))), end="\r")
+    S = SieveDatabase.from_vectors(S, path=mmap)
+    rng = default_rng(rng)
+    metrics = metrics or Metrics()
+    schedule = schedule or Schedule(gamma)
+    stop = stop or StopPolicy()
+    best = BestVector()
+    best.offer_db(S)
+    it = start
+    collisions = 0
+    nxt = None if mmap is None else mmap + '.next'
+
+    # Since the sieve could run for a long time, we catch a Ctrl+C, save
+    # a checkpoint and return the shortest vector found so far
+    try:
+        while len(S) > 0 and not stop.done(best, it - start, collisions):
+            S_0 = S
+            gamma = schedule.gamma
+            with metrics.phase('sieve'):
+                S_p = lattice_sieve(S, gamma, lsh, rng, dedup, nxt, backend)
+            reduced = len(S_p)
+            duplicates = S_p.index.rejected if dedup else 0
+            with metrics.phase('zero_removal'):
+                filter_vectors(S_p)
+            zeros = reduced - len(S_p)
+            if mmap is not None:
+                S_p.move(mmap)
+            collisions += zeros
+            S, it = S_p, it + 1
+            best.offer_db(S)
+            schedule.update(len(S) / len(S_0), S.mean_norm() / S_0.mean_norm() if len(S) else 0.0)
+
+            # Keep the set at the size the schedule asks for
+            if schedule.N is not None and sampler is not None and len(S) < schedule.N:
+                with metrics.phase('sampling'):
+                    sampler.fill(S, schedule.N - len(S))
+            metrics.record('nv', it, gamma=gamma, size=len(S), centers=len(S_0) - reduced - duplicates, zeros=zeros,
+                           duplicates=duplicates, dedup_rate=S_p.index.rate() if dedup else 0.0,
+                           mean_norm=S.mean_norm(), min_norm=float(np.sqrt(S.sq_norms.min(initial=np.inf))))
+            if len(S):
+                if checkpoint is not None and checkpoint.due():
+                    checkpoint.save(rng, it, S=S.vectors, gamma=schedule.gamma, target=schedule.N or 0)
+    except KeyboardInterrupt:
+        if checkpoint is not None and len(S):
+            checkpoint.save(rng, it, S=S.vectors, gamma=schedule.gamma, target=schedule.N or 0)
+    finally:
+        # A step that did not finish leaves its next set behind
+        if nxt is not None and os.path.exists(nxt):
+            os.remove(nxt)
     
     # Return the vector with smallest vector norm
-    return min(S_0, key=lambda v: norm(v))
+    return best.v
 
-def lattice_sieve(S, gamma):
+def lattice_sieve(S, gamma, lsh=None, rng=None, dedup=False, path=None, backend=None):
     """
         Helper method for the main sieving loop. Builds the next set of the sieve
         by checking to see if a vector is small enough or if there is a 'center' in the 
-        list of centers that can be used to reduce the vector.
+        list of centers that can be used to reduce the vector. With lsh set, the centers
+        are indexed by an AngularLSH and only colliding centers are checked. With dedup
+        set, vectors already in S_p up to sign are dropped (see sieve_db.VectorIndex).
+        With path set, S_p is memory-mapped to that file and the centers to a scratch
+        file next to it, removed before returning.
 
         Parameters:
-            S:      The current sieve set
+            S:      The current sieve set as a SieveDatabase
             gamma:  Norm reduction factor
+            lsh:    (tables, bits) to look up centers with angular LSH, None for a full scan
+            rng:    Seed or numpy Generator for the LSH hyperplanes
+            dedup:  Drop duplicates and negations from S_p
+            path:   File for S_p, None to keep it in RAM
+            backend: Kernel backend for the center lookup, NumPy by default
 
         Returns:
-            S_p:    Set for the next step of the sieve
+            S_p:    Set for the next step of the sieve as a SieveDatabase
     """
     
-    # Start with setting R as the max norm in our set
-    #R = norm(max(S, key=lambda v: norm(v)))
-    R = sum(norm(v) for v in S)/len(S)
-    # Make an empty list of centers and a list for the next step of the sieve
-    C = []
-    S_p = []
+    # Start with setting R as the mean norm in our set, using the cached norms
+    R = S.mean_norm()
+    # Make an empty database of centers and one for the next step of the sieve
+    C = SieveDatabase(S.d, dtype=S.dtype, path=None if path is None else path + '.centers')
+    S_p = SieveDatabase(S.d, capacity=len(S), dtype=S.dtype, dedup=dedup, path=path)
     gR = gamma*R
+    gR2 = gR*gR
+    index = AngularLSH(S.d, *lsh, rng=rng) if lsh is not None else None
 
-    # Run on each vector in S
-    for v in S:
-        # If the vector is small enough add it to S_p
-        if norm(v) <= gR:
-            S_p.append(v)
-        # Check if there is a close center
-        else:
-            res, c = exists_close_center(C, v, gR)
-
-            # If a close center is found, reduce the vector, else add it as a center
-            S_p.append(v - c) if res else C.append(v)
-    
+    # Run on each vector in S, the centers are scratch space and their file is
+    # removed even if the step is interrupted
+    try:
+        for v, sq in zip(S.vectors, S.sq_norms):
+            # If the vector is small enough add it to S_p
+            if sq <= gR2:
+                S_p.append(v, sq)
+            # Check if there is a close center
+            else:
+                res, c = exists_close_center(C, v, gR, index, backend)
+
+                # If a close center is found, reduce the vector, else add it as a center
+                if res:
+                    S_p.append(v - c)
+                else:
+                    i = C.append(v, sq)
+                    if index is not None:
+                        index.insert(i, v)
+    finally:
+        C.unlink()
     return S_p
 
-def exists_close_center(C, v, gR):
+def exists_close_center(C, v, gR, index=None, backend=None):
     """
         Given a vector v, check the list of centers to see if we can 
-        reduce v by one of the centers in C
+        reduce v by one of the centers in C. All centers are tested
+        at once against the matrix of C, or only the centers colliding
+        with v when an LSH index is given.
 
         Parameters:
-            C:          The list of centers
+            C:          The database of centers
             v:          The vector to reduce
             gR:         Norm reduction factor (gamma * R)
+            index:      Optional AngularLSH holding the indices of the centers
+            backend:    Kernel backend providing first_close(), NumPy by default
 
         Returns:
-            True, c:    The center if it is found
+            True, c:    The first center that is close enough
             False, 0:   If no center is found
 
     """
     
-    for c in C:
-        if norm(v - c) <= gR:
-            return (True, c)
+    ids = None if index is None else index.candidates(v)
+    V = C.vectors if ids is None else C.vectors[ids]
+    if len(V) == 0:
+        return (False, 0)
+    i = (first_close if backend is None else backend.first_close)(V, v, gR*gR)
+    if i >= 0:
+        return (True, C[i if ids is None else ids[i]])
     return (False, 0)
+
+def first_close(V, v, gR2):
+    """
+        Finds the first row of V within distance gR of v
+
+        Parameters:
+            V:      Matrix of centers
+            v:      The vector to reduce
+            gR2:    Squared reduction bound (gamma * R)^2
+
+        Returns:
+            i:      Index of the first close row, -1 if there is none
+    """
+    close = sq_norms(V - v) <= gR2
+    i = int(np.argmax(close))
+    return i if close[i] else -1
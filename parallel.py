@@ -0,0 +1,255 @@
+import os
+import numpy as np
+from multiprocessing import Pool, resource_tracker, shared_memory
+from pair_search import reduce_tile
+from g_sieve import reduce_by, reduce_longer
+from sieve_db import sq_norm
+
+# Views on the shared sieve set inside a worker process, set by _attach()
+_shared = {}
+
+def default_workers():
+    """ Number of worker processes to use when none is given """
+    return os.cpu_count() or 1
+
+def _attach(v_name, n_name, shape, dtype, path=None):
+    """
+        Worker initializer. Maps the shared vector matrix and squared norm
+        array of the parent into this process without copying them.
+
+        Parameters:
+            v_name: Name of the shared memory block holding the vectors
+            n_name: Name of the shared memory block holding the squared norms
+            shape:  Shape of the vector matrix
+            dtype:  dtype of the vector matrix
+            path:   .npy file to map the vectors from instead of v_name
+    """
+    n_shm = shared_memory.SharedMemory(name=n_name)
+    if path is not None:
+        _shared['shm'] = (n_shm,)
+        _shared['X'] = np.load(path, mmap_mode='r')[:shape[0]]
+    else:
+        v_shm = shared_memory.SharedMemory(name=v_name)
+        _shared['shm'] = (v_shm, n_shm)
+        _shared['X'] = np.ndarray(shape, dtype=dtype, buffer=v_shm.buf)
+    _shared['sq'] = np.ndarray(shape[0], dtype=np.float64, buffer=n_shm.buf)
+
+def _run_tile(task):
+    """
+        Worker body. Reduces one tile of pairs of the shared set.
+
+        Parameters:
+            task:   Tuple (i, j, tile, gR2, prefilter, backend) with the row
+                    offsets of the two blocks, the tile size, the squared
+                    reduction bound, whether to prefilter in float32 and the
+                    kernel backend (None for NumPy)
+
+        Returns:
+            V, sq:  The reduced vectors of the tile and their squared norms
+    """
+    i, j, tile, gR2, prefilter, backend = task
+    X, sq = _shared['X'], _shared['sq']
+    return reduce_tile(X[i:i+tile], sq[i:i+tile], X[j:j+tile], sq[j:j+tile], gR2, diagonal=(i == j), prefilter=prefilter,
+                       backend=backend)
+
+class SharedSet:
+    """
+        Copy of a SieveDatabase in shared memory. Workers attach to it by name,
+        so the set is never pickled. A memory-mapped database is not copied:
+        its file is flushed and mapped by the workers instead, and only the
+        squared norms go to shared memory. Use as a context manager; the
+        blocks are unlinked on exit.
+    """
+
+    def __init__(self, S):
+        X, sq = S.vectors, S.sq_norms
+        self.shape, self.dtype = X.shape, X.dtype
+        self.path = S.path
+        self._n = shared_memory.SharedMemory(create=True, size=max(sq.nbytes, 1))
+        np.ndarray(sq.shape, dtype=np.float64, buffer=self._n.buf)[:] = sq
+        if self.path is not None:
+            S.flush()
+            self._v = None
+        else:
+            self._v = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+            np.ndarray(X.shape, dtype=X.dtype, buffer=self._v.buf)[:] = X
+
+    def initargs(self):
+        """ Arguments for _attach() in the workers """
+        return (None if self._v is None else self._v.name, self._n.name, self.shape, self.dtype, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for shm in (self._v, self._n):
+            if shm is None:
+                continue
+            shm.close()
+            shm.unlink()
+
+def parallel_reducible_pairs(S, gR, tile=512, workers=None, prefilter=False, backend=None):
+    """
+        Parallel version of pair_search.reducible_pairs(). The set is placed in
+        shared memory and every worker gets whole tiles (pairs of contiguous
+        index ranges) to reduce. The reduced vectors stream back as arrays in
+        tile order, exactly as from the serial search, so a seeded run gives
+        the same result for any number of workers. A set of at most tile
+        vectors is a single tile, so only a smaller tile spreads it over the
+        workers.
+
+        Parameters:
+            S:          SieveDatabase to search
+            gR:         Reduction bound (gamma * R)
+            tile:       Number of rows in a tile
+            workers:    Number of worker processes, all cores by default
+            prefilter:  Test the pairs in float32 first, see pair_search.tile_pairs()
+            backend:    Kernel backend providing tile_pairs(), NumPy by default
+
+        Yields:
+            V, sq:      The reduced vectors of one tile and their squared norms
+    """
+    N = len(S)
+    workers = workers or default_workers()
+
+    # The tiles do not depend on the number of workers, so the result is the
+    # same as the serial search's
+    tasks = [(i, j, tile, gR*gR, prefilter, backend) for i in range(0, N, tile) for j in range(i, N, tile)]
+
+    with SharedSet(S) as shared:
+        with Pool(workers, initializer=_attach, initargs=shared.initargs()) as p:
+            for V, sq in p.imap(_run_tile, tasks):
+                if len(V):
+                    yield V, sq
+
+# Views on the snapshot of L inside a worker process, set by _attach_list()
+_list = {}
+
+def _attach_list(v_name, n_name, size, d, dtype):
+    # Maps the snapshot of L into this worker, reusing the mapping while the
+    # coordinator keeps the same shared memory blocks
+    if _list.get('names') != (v_name, n_name):
+        for shm in _list.get('shm', ()):
+            shm.close()
+        _list['shm'] = (shared_memory.SharedMemory(name=v_name), shared_memory.SharedMemory(name=n_name))
+        # The coordinator owns the blocks; without this the resource tracker
+        # would unlink them when a worker exits
+        for shm in _list['shm']:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        _list['names'] = (v_name, n_name)
+    v_shm, n_shm = _list['shm']
+    return np.ndarray((size, d), dtype=dtype, buffer=v_shm.buf), np.ndarray(size, dtype=np.float64, buffer=n_shm.buf)
+
+def _reduce_chunk(task):
+    """
+        Worker body of the parallel Gauss sieve. Reduces a chunk of candidates
+        by the snapshot of L, see reduce_by().
+
+        Parameters:
+            task:   Tuple (header, P, backend) with the arguments of _attach_list(),
+                    the matrix of candidates and the kernel backend (None for NumPy)
+
+        Returns:
+            P:      The reduced candidates
+    """
+    header, P, backend = task
+    V, sq = _attach_list(*header)
+    reduce = reduce_by if backend is None else backend.reduce_by
+    for p in P:
+        reduce(p, V, sq)
+    return P
+
+class ParallelReducer:
+    """
+        Process pool reducing batches of Gauss sieve candidates against a
+        snapshot of L in shared memory. The snapshot is copied into the same
+        blocks before every batch, and the blocks are only reallocated (doubled)
+        when L outgrows them, so the workers rarely have to map new ones. Use as
+        a context manager; the pool is closed and the blocks unlinked on exit.
+
+        Attributes:
+            d:          Dimension of the vectors
+            dtype:      dtype of the vectors
+            workers:    Number of worker processes
+            backend:    Kernel backend providing reduce_by(), None for NumPy
+    """
+
+    def __init__(self, d, dtype, workers, backend=None):
+        self.d = d
+        self.dtype = np.dtype(dtype)
+        self.workers = workers
+        self.backend = backend
+        self._v = self._n = None
+        self._cap = 0
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = Pool(self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.terminate()
+        self._pool.join()
+        self._release()
+
+    def _release(self):
+        # Unlinks the shared memory blocks of the snapshot
+        for shm in (self._v, self._n):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._v = self._n = None
+
+    def _snapshot(self, L):
+        # Copies L into shared memory and returns the header for the workers
+        if len(L) > self._cap or self._v is None:
+            self._release()
+            self._cap = max(2*self._cap, len(L), 16)
+            self._v = shared_memory.SharedMemory(create=True, size=self._cap*self.d*self.dtype.itemsize)
+            self._n = shared_memory.SharedMemory(create=True, size=self._cap*8)
+        np.ndarray((len(L), self.d), dtype=self.dtype, buffer=self._v.buf)[:] = L.vectors
+        np.ndarray(len(L), dtype=np.float64, buffer=self._n.buf)[:] = L.sq_norms
+        return (self._v.name, self._n.name, len(L), self.d, self.dtype)
+
+    def reduce(self, P, L):
+        """
+            Reduces a batch of candidates by the current L in parallel
+
+            Parameters:
+                P:  List of candidate vectors
+                L:  SieveDatabase sorted by norm
+
+            Returns:
+                P:  The reduced candidates, in the same order
+        """
+        header = self._snapshot(L)
+        chunks = np.array_split(np.asarray(P, dtype=self.dtype), self.workers)
+        return [p for R in self._pool.map(_reduce_chunk, [(header, C, self.backend) for C in chunks if len(C)]) for p in R]
+
+    def commit(self, p, L, S, fresh):
+        """
+            Brings a candidate reduced by the snapshot up to date with L. It is
+            reduced by the vectors inserted since the snapshot (fresh), and by
+            all of L if that changed it; a non-zero result then reduces the
+            longer vectors of L as in gauss_reduce() and is added to fresh.
+
+            Parameters:
+                p:      The candidate, reduced by the snapshot of L
+                L:      SieveDatabase sorted by norm
+                S:      Stack that receives the vectors removed from L
+                fresh:  SieveDatabase of the vectors inserted since the snapshot
+
+            Returns:
+                p:      The reduced candidate
+                p_sq:   Its squared norm, 0 for a collision
+        """
+        reduce = reduce_by if self.backend is None else self.backend.reduce_by
+        p_sq = sq_norm(p)
+        p, sq = reduce(p, fresh.vectors, fresh.sq_norms)
+        if sq != p_sq:
+            p, sq = reduce(p, L.vectors, L.sq_norms)
+        if sq != 0:
+            reduce_longer(p, sq, L, S)
+            reduce_longer(p, sq, fresh, [])
+            fresh.insert_sorted(p, sq)
+        return p, sq
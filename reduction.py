@@ -0,0 +1,214 @@
+import time
+import numpy as np
+from itertools import count
+
+def gso(B):
+    """
+        Gram-Schmidt orthogonalization of the rows of B, computed from a QR
+        decomposition
+
+        Parameters:
+            B:      Matrix whose rows are the basis vectors
+
+        Returns:
+            mu:     Lower triangular matrix of the coefficients mu[i][j] = <b_i, b*_j>/<b*_j, b*_j>
+            Bn:     Squared norms of the Gram-Schmidt vectors b*_i
+    """
+    R = np.linalg.qr(B.T.astype(np.float64), mode='r')
+    diag = np.diag(R)
+    return (R / diag[:, None]).T, diag**2
+
+def _lll_rows(B, delta):
+    """
+        In-place LLL reduction of the rows of an integer matrix. The
+        Gram-Schmidt data is kept in floating point and updated incrementally
+        on every size reduction and swap.
+
+        Parameters:
+            B:      Integer matrix whose rows are the basis vectors
+            delta:  Lovasz constant
+
+        Returns:
+            swaps:  Number of swaps performed
+    """
+    mu, Bn = gso(B)
+    d = len(B)
+    k = 1
+    swaps = 0
+    while k < d:
+        # Size reduce b_k against b_{k-1}, ..., b_0
+        for j in range(k-1, -1, -1):
+            m = int(np.rint(mu[k, j]))
+            if m:
+                B[k] -= m*B[j]
+                mu[k, :j] -= m*mu[j, :j]
+                mu[k, j] -= m
+
+        # Lovasz condition holds, move on
+        if Bn[k] >= (delta - mu[k, k-1]**2)*Bn[k-1]:
+            k += 1
+            continue
+
+        # Swap b_k and b_{k-1} and update the Gram-Schmidt data
+        m = mu[k, k-1]
+        b = Bn[k] + m*m*Bn[k-1]
+        mu[k, k-1] = m*Bn[k-1]/b
+        Bn[k] = Bn[k-1]*Bn[k]/b
+        Bn[k-1] = b
+        B[[k-1, k]] = B[[k, k-1]]
+        mu[[k-1, k], :k-1] = mu[[k, k-1], :k-1]
+        t = mu[k+1:, k].copy()
+        mu[k+1:, k] = mu[k+1:, k-1] - m*t
+        mu[k+1:, k-1] = t + mu[k, k-1]*mu[k+1:, k]
+        swaps += 1
+        k = max(k-1, 1)
+    return swaps
+
+def lll(basis, delta=0.99):
+    """
+        LLL-reduces a lattice basis
+
+        Parameters:
+            basis:  Basis matrix, one basis vector per column
+            delta:  Lovasz constant
+
+        Returns:
+            A:      The reduced basis, one basis vector per column
+            swaps:  Number of swaps performed
+    """
+    B = np.array(basis.T, dtype=np.int64)
+    swaps = _lll_rows(B, delta)
+    return B.T.astype(basis.dtype), swaps
+
+def enum_svp(mu, Bn, R2):
+    """
+        Schnorr-Euchner enumeration of the shortest nonzero vector of the
+        lattice with Gram-Schmidt data (mu, Bn) that is shorter than sqrt(R2).
+        The search radius shrinks every time a shorter vector is found.
+
+        Parameters:
+            mu:     Gram-Schmidt coefficients of the block
+            Bn:     Squared Gram-Schmidt norms of the block
+            R2:     Squared search radius
+
+        Returns:
+            x:      Integer coefficients of the shortest vector, or None if no
+                    nonzero vector is shorter than sqrt(R2)
+    """
+    n = len(Bn)
+    x = [0]*n
+    best = [None, R2]
+
+    # Candidates for one coordinate in order of increasing distance to its center
+    def zigzag(c):
+        x0 = int(round(c))
+        s = 1 if c >= x0 else -1
+        yield x0
+        for i in count(1):
+            yield x0 + s*i
+            yield x0 - s*i
+
+    def search(k, partial, top):
+        # While all coordinates above are zero, only nonnegative values are
+        # tried, so that v and -v are not both enumerated
+        c = -sum(x[j]*mu[j, k] for j in range(k+1, n))
+        for xk in (count(0) if top else zigzag(c)):
+            l = partial + (xk - c)**2*Bn[k]
+            if l >= best[1]:
+                break
+            x[k] = xk
+            if k > 0:
+                search(k-1, l, top and xk == 0)
+            elif not (top and xk == 0):
+                best[0], best[1] = list(x), l
+        x[k] = 0
+
+    search(n-1, 0.0, True)
+    return best[0]
+
+def _egcd(a, b):
+    # Returns (g, s, t) with s*a + t*b = g = gcd(a, b) >= 0
+    if b == 0:
+        return (abs(a), 1 if a >= 0 else -1, 0)
+    g, s, t = _egcd(b, a % b)
+    return (g, t, s - (a // b)*t)
+
+def _insert(B, k, x):
+    """
+        Applies a unimodular transformation to the rows B[k], ..., B[k+len(x)-1]
+        so that B[k] becomes sum(x_i B[k+i]) / gcd(x). Pairs of neighbouring rows
+        are merged from the end with extended gcds, so the lattice is unchanged.
+    """
+    x = list(x)
+    for i in range(len(x)-1, 0, -1):
+        a, b = x[i-1], x[i]
+        if b == 0:
+            continue
+        g, s, t = _egcd(a, b)
+        u, v = B[k+i-1].copy(), B[k+i].copy()
+        B[k+i-1] = (a // g)*u + (b // g)*v
+        B[k+i] = -t*u + s*v
+        x[i-1], x[i] = g, 0
+
+def bkz(basis, beta, delta=0.99, max_tours=8):
+    """
+        Block Korkine-Zolotarev reduction. Starting from an LLL-reduced basis,
+        every block of beta consecutive vectors is searched for a projected
+        vector shorter than the first Gram-Schmidt vector of the block; when
+        one is found it is inserted and the basis is LLL-reduced again. Tours
+        are repeated until nothing changes or max_tours is reached.
+
+        Parameters:
+            basis:      Basis matrix, one basis vector per column
+            beta:       Block size
+            delta:      Lovasz constant
+            max_tours:  Maximum number of tours
+
+        Returns:
+            A:          The reduced basis, one basis vector per column
+            stats:      Dict with the number of tours, insertions and LLL swaps
+    """
+    B = np.array(basis.T, dtype=np.int64)
+    d = len(B)
+    stats = {'tours': 0, 'insertions': 0, 'swaps': _lll_rows(B, delta)}
+    for _ in range(max_tours):
+        stats['tours'] += 1
+        changed = False
+        for k in range(d-1):
+            h = min(k+beta, d)
+            mu, Bn = gso(B)
+            x = enum_svp(mu[k:h, k:h], Bn[k:h], delta*Bn[k])
+            if x is not None:
+                _insert(B, k, x)
+                stats['swaps'] += _lll_rows(B, delta)
+                stats['insertions'] += 1
+                changed = True
+        if not changed:
+            break
+    return B.T.astype(basis.dtype), stats
+
+def preprocess(basis, method):
+    """
+        Reduces a basis before sieving
+
+        Parameters:
+            basis:  Basis matrix, one basis vector per column
+            method: 'lll' or 'bkz:beta'
+
+        Returns:
+            A:      The reduced basis
+            stats:  Dict with the method, its wall time, its counters and the
+                    norm of the shortest basis vector
+    """
+    t = time.perf_counter()
+    if method == 'lll':
+        A, swaps = lll(basis)
+        stats = {'swaps': swaps}
+    elif method.startswith('bkz:'):
+        A, stats = bkz(basis, int(method[4:]))
+    else:
+        raise ValueError("Unknown preprocessing method " + method)
+    stats['method'] = method
+    stats['time'] = time.perf_counter() - t
+    stats['min_basis_norm'] = float(np.sqrt(np.min(np.sum(A.astype(np.float64)**2, axis=0))))
+    return A, stats
@@ -1,11 +1,14 @@
 import numpy as np
 from numpy.random import default_rng
+from reduction import gso
 
-def sample_vec(basis, N, n, r, q):
+def sample_vec(basis, N, n, r, q, rng=None):
     """
         Given a basis for a lattice, sample N lattice vectors.
         We draw from a Gaussian distribution, but round the points to
-        the nearest integer, to effectively draw from a 'Discrete Gaussian'
+        the nearest integer, to effectively draw from a 'Discrete Gaussian'.
+        All N coefficient vectors are drawn and rounded as one (N, d) block and
+        multiplied by the basis with a single matrix product.
 
         Parameters:
             basis:  The lattice basis
@@ -13,22 +16,196 @@ def sample_vec(basis, N, n, r, q):
             n:      Number of vectors for Ajtai generator
             r:      Dimension of vectors for Ajtai generator
             q:      Prime modulus for Ajtai generator
+            rng:    Seed or numpy Generator, for reproducible runs
 
         Returns:
-            S:      Set containing the generated lattice vectors
-    """
-    S = []
-    rng = default_rng()
-    
-    for _ in range(N):
-        # Draw from a normal distribution
-        x = rng.normal(0, 2*q, n+r)
-
-        # Round off the coordinates to the nearest integer
-        x = np.array([int(v) for v in x]).reshape(n+r, 1)
-        
-        # Compute lattice vector by multiplying it with the basis
-        S.append(basis.dot(x).reshape(n+r))
-    
-    # Return the vectors
-    return S
\ No newline at end of file
+            S:      (N, n+r) matrix whose rows are the generated lattice vectors
+    """
+    rng = default_rng(rng)
+
+    # Draw from a normal distribution and round off the coordinates to the nearest integer
+    X = np.rint(rng.normal(0, 2*q, (N, n+r)))
+
+    # Compute the lattice vectors by multiplying with the basis
+    return lattice_vectors(X, basis)
+
+def lattice_vectors(X, basis):
+    """
+        Maps integer coefficient vectors (rows of X) to lattice vectors.
+        The product is done as a float64 GEMM whenever every entry of the
+        result is guaranteed to be exact in double precision, and falls back
+        to an integer product otherwise. The result has the dtype of the basis
+        unless its entries could overflow it, in which case int64 is used.
+
+        Parameters:
+            X:      Matrix of integer coefficients, one row per vector
+            basis:  The lattice basis, one basis vector per column
+
+        Returns:
+            S:      Matrix of lattice vectors with the dtype of the basis
+    """
+    bound = np.abs(X).max(initial=0) * np.abs(basis).max(initial=0) * basis.shape[1]
+    dtype = basis.dtype if bound <= np.iinfo(basis.dtype).max else np.dtype(np.int64)
+    if bound < 2**53:
+        return (X @ basis.T.astype(np.float64)).astype(dtype)
+    return X.astype(dtype) @ basis.T.astype(dtype)
+
+class GaussianSampler:
+    """
+        Buffered version of sample_vec(). Vectors are generated a batch at a
+        time and handed out one by one, so drawing a single vector (as the
+        Gauss sieve does whenever its stack is empty) costs a row copy instead
+        of a full sampling call.
+
+        For progressive sieving the sampler can be restricted to the sublattice
+        spanned by the first k basis vectors, taken in the given order.
+
+        Attributes:
+            basis:  The lattice basis
+            sigma:  Width of the continuous Gaussian, 2q by default
+            batch:  Number of vectors generated per refill
+            rng:    The numpy Generator used for sampling
+            order:  Order in which basis vectors (columns) enter the sublattice
+            k:      Number of basis vectors currently sampled from
+    """
+
+    def __init__(self, basis, n, r, q, batch=256, sigma=None, rng=None, order=None):
+        self.basis = basis
+        self.d = n + r
+        self.sigma = 2*q if sigma is None else sigma
+        self.batch = batch
+        self.rng = default_rng(rng)
+        self.order = np.arange(self.d) if order is None else np.asarray(order)
+        self._buf = np.zeros((0, self.d), dtype=basis.dtype)
+        self._pos = 0
+        self.restrict(self.d)
+
+    def restrict(self, k):
+        """
+            Samples from the sublattice of the first k basis vectors from now on,
+            discarding any buffered vectors
+        """
+        self.k = k
+        self._sub = self.basis[:, self.order[:k]]
+        self._buf = self._buf[:0]
+        self._pos = 0
+
+    def sample(self, N):
+        """
+            Draws N fresh vectors, bypassing the buffer
+
+            Parameters:
+                N:  Number of vectors
+
+            Returns:
+                S:  (N, d) matrix of lattice vectors
+        """
+        X = np.rint(self.rng.normal(0, self.sigma, (N, self.k)))
+        return lattice_vectors(X, self._sub)
+
+    def fill(self, S, N, block=65536):
+        """
+            Appends N fresh vectors to a SieveDatabase. A memory-mapped database
+            is filled block rows at a time, so only one block of coefficients
+            and vectors is ever in RAM; one in RAM gets a single sample() call.
+
+            Parameters:
+                S:      The sieve_db.SieveDatabase
+                N:      Number of vectors
+                block:  Rows sampled at a time for a mapped database
+
+            Returns:
+                S:      The database
+        """
+        if S.path is None:
+            block = max(N, 1)
+        for i in range(0, N, block):
+            S.extend(self.sample(min(block, N - i)))
+        return S
+
+    def pending(self):
+        """
+            The buffered vectors that have not been drawn yet
+        """
+        return self._buf[self._pos:]
+
+    def restore(self, V):
+        """
+            Replaces the buffer, e.g. with the pending() vectors of a checkpointed sampler
+        """
+        self._buf = np.asarray(V, dtype=self.basis.dtype).reshape(-1, self.d)
+        self._pos = 0
+
+    def draw(self):
+        """
+            Returns a single lattice vector from the buffer, refilling it when empty
+        """
+        if self._pos == len(self._buf):
+            self._buf = self.sample(self.batch)
+            self._pos = 0
+        v = self._buf[self._pos].copy()
+        self._pos += 1
+        return v
+
+class KleinSampler(GaussianSampler):
+    """
+        Klein's sampler (randomized nearest plane, as in GPV): the coefficients
+        are drawn from the last basis vector to the first, each from a discrete
+        Gaussian over the integers centered where the nearest plane algorithm
+        would round to, with width sigma/||b*_i||. The result is a discrete
+        Gaussian over the lattice whose width does not depend on how long the
+        basis vectors are, so with a reduced basis the samples are much
+        shorter than those of GaussianSampler.
+
+        The Gram-Schmidt data of the basis, taken in the given order, is
+        computed once; the sublattice of the first k vectors uses its leading
+        k x k block. Zero vectors are never returned.
+
+        Attributes:
+            sigma:  Standard deviation of the discrete Gaussian. By default the
+                    GPV bound max ||b*_i|| * sqrt(ln(2d + 4)/pi), converted
+                    from the exp(-pi x^2/s^2) convention.
+            tail:   Tail cut of the rejection sampler, in multiples of the width
+    """
+
+    def __init__(self, basis, n, r, q, batch=256, sigma=None, rng=None, order=None, tail=6):
+        order = np.arange(n + r) if order is None else np.asarray(order)
+        self._mu, self._Bn = gso(basis[:, order].T)
+        if sigma is None:
+            sigma = np.sqrt(self._Bn.max() * np.log(2*(n + r) + 4) / np.pi) / np.sqrt(2*np.pi)
+        self.tail = tail
+        super().__init__(basis, n, r, q, batch, sigma, rng, order)
+
+    def _sample_z(self, c, s):
+        # Rejection sampling of D_{Z,c,s} for every center in c, from uniform
+        # proposals within tail*s of the center
+        z = np.empty(len(c))
+        todo = np.arange(len(c))
+        while len(todo):
+            cc = c[todo]
+            lo = np.floor(cc - self.tail*s)
+            z_try = lo + np.floor(self.rng.random(len(todo)) * (np.ceil(cc + self.tail*s) - lo + 1))
+            ok = self.rng.random(len(todo)) < np.exp(-(z_try - cc)**2 / (2*s*s))
+            z[todo[ok]] = z_try[ok]
+            todo = todo[~ok]
+        return z
+
+    def sample(self, N):
+        """
+            Draws N fresh nonzero vectors, bypassing the buffer
+
+            Parameters:
+                N:  Number of vectors
+
+            Returns:
+                S:  (N, d) matrix of lattice vectors
+        """
+        k = self.k
+        mu, Bn = self._mu[:k, :k], self._Bn[:k]
+        X = np.zeros((0, k))
+        while len(X) < N:
+            Y = np.zeros((N - len(X), k))
+            for i in range(k-1, -1, -1):
+                Y[:, i] = self._sample_z(-(Y[:, i+1:] @ mu[i+1:, i]), self.sigma / np.sqrt(Bn[i]))
+            X = np.concatenate((X, Y[np.any(Y != 0, axis=1)]))
+        return lattice_vectors(X, self._sub)
@@ -0,0 +1,73 @@
+from math import ceil
+
+class Schedule:
+    """
+        Chooses the reduction factor gamma and the target set size N for every
+        iteration of the NV and double sieves. This base policy keeps gamma
+        fixed and has no target size, so the set shrinks as the sieve goes,
+        as in the plain sieves. Other policies override update(). When to
+        stop is up to a stopping.StopPolicy.
+
+        Attributes:
+            gamma:          Reduction factor for the next iteration
+            N:              Target set size, the sieves top the set up to it
+                            from their sampler. None for no target.
+    """
+
+    def __init__(self, gamma, N=None):
+        self.gamma = gamma
+        self.N = N
+
+    def update(self, yield_, progress):
+        """
+            Adjusts gamma and N after an iteration
+
+            Parameters:
+                yield_:     Vectors produced by the iteration relative to the
+                            set size (marked/N for the double sieve, the share
+                            of the set that survives for NV)
+                progress:   Ratio of the new mean norm to the previous one
+        """
+        pass
+
+class AdaptiveSchedule(Schedule):
+    """
+        Keeps the yield of every iteration within [low, high]. When it falls
+        below low the set is about to collapse, so gamma is relaxed towards
+        gamma_max by two steps, and once gamma_max is reached the target size
+        N grows by a factor growth (up to N_max). Fresh samples are long and
+        pull the mean norm back up, so growing N is the last resort; since the
+        number of reducible pairs grows with N^2 it does help the double sieve
+        recover. When the yield exceeds high, or the mean norm decreased by
+        less than a factor 1 - stall, gamma is tightened by one step towards
+        gamma_min to make more progress per iteration.
+
+        Attributes:
+            low, high:              Target band of the yield
+            step:                   Change of gamma per adjustment
+            growth:                 Growth factor of N
+            gamma_min, gamma_max:   Range of gamma
+            N_max:                  Largest target size
+            stall:                  Relative norm decrease below which gamma is tightened
+    """
+
+    def __init__(self, gamma, N, low=1.0, high=4.0, step=0.01, growth=1.25, gamma_min=0.8, gamma_max=0.999,
+                 N_max=None, stall=0.01):
+        super().__init__(gamma, N)
+        self.low = low
+        self.high = high
+        self.step_size = step
+        self.growth = growth
+        self.gamma_min = gamma_min
+        self.gamma_max = gamma_max
+        self.N_max = N_max or 8*N
+        self.stall = stall
+
+    def update(self, yield_, progress):
+        if yield_ < self.low:
+            if self.gamma < self.gamma_max:
+                self.gamma = min(self.gamma_max, self.gamma + 2*self.step_size)
+            else:
+                self.N = min(self.N_max, int(ceil(self.N*self.growth)))
+        elif yield_ > self.high or progress > 1 - self.stall:
+            self.gamma = max(self.gamma_min, self.gamma - self.step_size)
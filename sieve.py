@@ -1,71 +1,384 @@
 #!/usr/bin/python3
 
+import os
+import json
 import argparse
+import importlib.util
+import numpy as np
 from numpy.linalg import norm
-from sample import sample_vec
-from ajtai_generator import gen_basis
-from nv_sieve import nguyen_vidick_sieve
-from g_sieve import gauss_sieve
-from k_sieve import double_sieve
+from numpy.random import default_rng
+from metrics import Metrics
+from schedule import Schedule, AdaptiveSchedule
+from stopping import StopPolicy, target_norm
 
-def main(args):
+# The sieve backends, the basis generator, the basis reduction and the
+# checkpoint code are imported in solve() only when they are used, and the
+# sieves import the process pools (parallel.py) only with more than one
+# worker, so a serial run does not pay for multiprocessing.
+
+def make_schedule(args, gamma, N, state, low, high):
     """
-        Main method for running a sieving algorithm. This method prints
-        the shortest vector found using the specified sieving algorithm
+        Builds the gamma/N schedule of the NV and double sieves from the
+        command line, picking up gamma and the target size from a checkpoint
 
         Parameters:
-            args:   Contains a Namespace object with arguments necessary for
-                    running a specific sieve
+            args:       Namespace with the parsed command line arguments
+            gamma:      Initial reduction factor
+            N:          Initial set size
+            state:      Checkpoint contents, or None
+            low, high:  Yield band of the adaptive schedule for this sieve
 
+        Returns:
+            schedule:   A schedule.Schedule
     """
-    
-    # Get Ajtai generator parameters
-    n, r, q = args.n[0], args.r[0], args.q[0]
-    basis, w = gen_basis(n, r, q)
+    if state is not None:
+        gamma, N = state.get('gamma', gamma), state.get('target') or N
+    if args.schedule == "adaptive":
+        return AdaptiveSchedule(gamma, N, low, high)
+    return Schedule(gamma)
+
+def load_basis(path, n=None, r=None, q=None):
+    """
+        Reads the basis of --basis-file, a .npy file or an fplll text file as
+        written by ajtai_generator.save_basis() and --save-basis. The Ajtai
+        parameters given on the command line are used, the others come from
+        the sidecar file path + '.json' that --save-basis writes next to the
+        basis, along with the planted vector.
+
+        Parameters:
+            path:   The basis file
+            n, r, q: Ajtai parameters from the command line, or None
+
+        Returns:
+            basis:  The basis matrix, one basis vector per column
+            n, r, q: Its Ajtai parameters
+            w:      The planted short vector, or None
+    """
+    from ajtai_generator import load_basis as read_basis
+    meta = {}
+    if os.path.isfile(path + '.json'):
+        with open(path + '.json') as f:
+            meta = json.load(f)
+    n, r, q = (meta.get(name) if value is None else value for name, value in (('n', n), ('r', r), ('q', q)))
+    if None in (n, r, q):
+        raise SystemExit("-n, -r and -q are needed for " + path + ", which has no sidecar " + path + ".json")
+    try:
+        basis = read_basis(path)
+    except (ValueError, OSError):
+        raise SystemExit("Basis file " + path + " is neither a .npy file nor an fplll text basis")
+    if basis.shape != (n + r, n + r):
+        raise SystemExit("Basis file " + path + " does not hold a basis of dimension n + r = " + str(n + r))
+    w = np.asarray(meta['w'], dtype=basis.dtype) if 'w' in meta else None
+    return basis, n, r, q, w
+
+def save_basis(path, basis, n, r, q, w=None):
+    """ Writes a basis with ajtai_generator.save_basis() and its parameters to path + '.json', for --basis-file """
+    from ajtai_generator import save_basis as write_basis
+    write_basis(path, basis)
+    meta = {'n': n, 'r': r, 'q': q}
+    if w is not None:
+        meta['w'] = [int(x) for x in w]
+    with open(path + '.json', 'w') as f:
+        json.dump(meta, f)
+
+def load_samples(path, d):
+    """
+        Reads a set of lattice vectors, one per row, from a .npy file (or the
+        array S of a .npz file, e.g. a checkpoint)
+
+        Parameters:
+            path:   The file
+            d:      Dimension of the lattice
+
+        Returns:
+            S:      The vectors as an integer matrix
+    """
+    S = np.load(path, allow_pickle=False)
+    if isinstance(S, np.lib.npyio.NpzFile):
+        with S:
+            if 'S' not in S.files:
+                raise SystemExit("Samples file " + path + " has no array S")
+            S = S['S']
+    if S.ndim != 2 or S.shape[1] != d or not np.issubdtype(S.dtype, np.integer):
+        raise SystemExit("Samples file " + path + " must hold integer vectors of dimension " + str(d))
+    return S
+
+def solve(args, callback=None):
+    """
+        Runs the sieving algorithm given by the parsed command line
+
+        Parameters:
+            args:       Contains a Namespace object with arguments necessary for
+                        running a specific sieve
+            callback:   Optional function receiving every metrics record
+
+        Returns:
+            v:          The shortest vector found, None if the budget ran out
+                        before the sieve had any vector
+    """
+
+    # When resuming, the basis, its parameters, the RNG and the sieve state
+    # all come from the checkpoint
+    state = None
+    if args.resume is not None:
+        from checkpoint import load_checkpoint
+        state = load_checkpoint(args.resume)
+        if state['sieve'] != args.subparser_name:
+            raise SystemExit("Checkpoint " + args.resume + " is from the " + state['sieve'] + " sieve")
+        basis, n, r, q, rng = state['basis'], state['n'], state['r'], state['q'], state['rng']
+        w = state.get('w')
+    elif args.basis_file is not None:
+        # A pre-generated basis replaces the Ajtai generator
+        basis, n, r, q, w = load_basis(args.basis_file, *(None if a is None else a[0] for a in (args.n, args.r, args.q)))
+        rng = default_rng(args.seed)
+    else:
+        # Get Ajtai generator parameters
+        from ajtai_generator import gen_basis
+        n, r, q = args.n[0], args.r[0], args.q[0]
+        rng = default_rng(args.seed)
+        basis, w = gen_basis(n, r, q, rng)
     d = n + r
-    
+    if args.save_basis is not None and state is None:
+        save_basis(args.save_basis, basis, n, r, q, w)
+    # The NumPy kernels are the default, another backend is only imported when asked for
+    backend = None
+    if args.backend != "numpy":
+        from backend import get_backend
+        backend = get_backend(args.backend)
+    if stages_too_large(args, d):
+        raise SystemExit("-progressive k0 must be at most the lattice dimension " + str(d))
+
+    # A pre-sampled starting set for the NV and double sieves
+    samples = None
+    if state is None and args.samples_file is not None:
+        samples = load_samples(args.samples_file, d)
+
+    # Per-iteration metrics go to a file and/or a progress line
+    metrics = Metrics(args.metrics_file, callback=callback, progress=args.progress, every=args.metrics_every)
+
+    # Sublattice dimensions for progressive sieving: k0, k0 + step, ..., d
+    stages = None
+    if getattr(args, 'progressive', None) is not None:
+        k0, step = args.progressive
+        stages = list(range(k0, d, step)) + [d]
+    if state is not None:
+        stages = resumed_stages(args, state, stages)
+
+    # Reduce the basis before sampling from it. A resumed run already has the
+    # basis it was started with.
+    if state is None and args.preprocess is not None:
+        from reduction import preprocess
+        with metrics.phase('preprocess'):
+            basis, stats = preprocess(basis, args.preprocess)
+        metrics.summary('preprocess', **stats)
+    # Progressive stages take basis vectors in column order. A reduced basis
+    # is already ordered from short to long; a raw Ajtai basis gets its q-ary
+    # vectors first, so that every stage is a smaller Ajtai lattice.
+    elif state is None and stages is not None:
+        basis = basis[:, np.r_[n:d, 0:n]]
+
+    # Write periodic checkpoints, by default to the file we resumed from
+    checkpoint = None
+    path = args.checkpoint or args.resume
+    if path is not None:
+        from checkpoint import Checkpoint
+        meta = dict(sieve=args.subparser_name, basis=basis, n=n, r=r, q=q, stages=np.asarray(stages or [], dtype=np.int64))
+        if w is not None:
+            meta['w'] = w
+        checkpoint = Checkpoint(path, args.checkpoint_interval, **meta)
+    start = state['iteration'] if state is not None else 0
+
     # Compute the Minkowski bound
     minkowski_bound = (d**(0.5))*(q**r)**(1/d)
+
+    # Every sieve stops at the target norm or when a budget runs out. The
+    # double sieve stops at the Minkowski bound unless told otherwise.
+    try:
+        target = target_norm(args.target_norm, args.target_minkowski, args.target_planted, minkowski_bound, w)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if target is None and args.subparser_name == "double":
+        target = minkowski_bound
+    stop = StopPolicy(target, args.max_time, args.max_iterations, args.max_collisions)
+
+    # Fresh vectors for every sieve come from the chosen sampler, restricted
+    # to the current sublattice when sieving progressively
+    from sample import GaussianSampler, KleinSampler
+    Sampler = KleinSampler if args.sampler == "klein" else GaussianSampler
+    sampler = Sampler(basis, n, r, q, sigma=args.sigma, rng=rng)
+    stage = state.get('stage', 0) if state is not None else 0
+    if stages is not None:
+        sampler.restrict(stages[stage])
     
     # Run the Nguyen-Vidick sieve
     if args.subparser_name == "nv":
-        N,  gamma = args.N[0], args.gamma[0]
-        S = sample_vec(basis, N, n, r, q)
+        from nv_sieve import nguyen_vidick_sieve
+        N, gamma = starting_size(args, samples), args.gamma[0]
+        with metrics.phase('sampling'):
+            S = state['S'] if state is not None else samples[:N] if samples is not None else starting_set(args, sampler, N, d)
         sieve = nguyen_vidick_sieve
-        arguments = [S, gamma]
+        # The share of the set surviving an iteration is the yield
+        schedule = make_schedule(args, gamma, N, state, 0.5, 0.9)
+        kwargs = dict(S=S, gamma=gamma, lsh=args.lsh, rng=rng, checkpoint=checkpoint, start=start, metrics=metrics, dedup=args.dedup,
+                      sampler=sampler, schedule=schedule, stop=stop, mmap=args.mmap, backend=backend)
     
     # Run the Gauss sieve
     elif args.subparser_name == "gauss":
+        from g_sieve import gauss_sieve
         c = args.c[0]
         sieve = gauss_sieve
-        arguments = [basis, c]
+        kwargs = dict(basis=basis, c=c, rng=rng, checkpoint=checkpoint, state=state, metrics=metrics, stages=stages, params=(n, r, q),
+                      sampler=sampler, stop=stop, workers=args.workers, batch=args.batch, backend=backend)
 
     # Run the Double sieve
     elif args.subparser_name == "double":
+        from k_sieve import double_sieve
         gamma = args.gamma[0]
-        d = n+r
-        N = args.N[0] if args.N is not None else int(2**(0.208*d))
-        S = sample_vec(basis, N, n, r, q)
+        N = starting_size(args, samples, int(2**((0.208 if args.k == 2 else 0.189)*d)))
+        with metrics.phase('sampling'):
+            S = state['S'] if state is not None else samples[:N] if samples is not None else starting_set(args, sampler, N, d)
         sieve = double_sieve
-        arguments = [S, gamma, minkowski_bound]
+        # Reducible pairs per vector is the yield
+        schedule = make_schedule(args, gamma, N, state, 1.0, 8.0)
+        kwargs = dict(S=S, gamma=gamma, minkowski_bound=minkowski_bound, tile=args.tile, workers=args.workers, lsh=args.lsh, rng=rng,
+                      checkpoint=checkpoint, start=start, metrics=metrics, stages=stages, sampler=sampler, stage=stage,
+                      dedup=args.dedup, schedule=schedule, stop=stop, compact=args.compact, k=args.k, alpha=args.alpha,
+                      mmap=args.mmap, backend=backend, size=state.get('size') if state is not None else None)
 
     # Get the shortest vector found
-    v = sieve(*arguments)
+    try:
+        return sieve(**kwargs)
+    finally:
+        metrics.close()
+
+def starting_size(args, samples, default=None):
+    """
+        Size of the starting set of the NV and double sieves: -N, else the
+        number of pre-sampled vectors, else the default
+    """
+    if args.N is not None:
+        if samples is not None and len(samples) < args.N[0]:
+            raise SystemExit("Samples file " + args.samples_file + " has fewer than " + str(args.N[0]) + " vectors")
+        return args.N[0]
+    return len(samples) if samples is not None else default
+
+def starting_set(args, sampler, N, d):
+    """
+        Samples the starting set of the NV and double sieves. With -mmap it is
+        sampled block by block straight into the mapped file, so the whole set
+        is never held in RAM.
+    """
+    if args.mmap is None:
+        return sampler.sample(N)
+    from sieve_db import SieveDatabase
+    compact = getattr(args, 'compact', False)
+    S = SieveDatabase(d, capacity=N, dtype=np.int8 if compact else np.int64, narrow=compact, path=args.mmap)
+    return sampler.fill(S, N)
+
+def resumed_stages(args, state, stages):
+    """
+        The progressive stages of a resumed run. They are taken from the
+        checkpoint, so -progressive need not be given again, but must match
+        if it is. A checkpoint written before the stages were saved keeps the
+        stages of the command line.
+
+        Parameters:
+            args:       Namespace with the parsed command line arguments
+            state:      Checkpoint contents
+            stages:     Stages from -progressive, or None
+
+        Returns:
+            stages:     The stages to resume with, None for a full-lattice run
+    """
+    if 'stages' not in state:
+        if stages is None and state.get('stage', 0) > 0:
+            raise SystemExit("Checkpoint " + args.resume + " is from a progressive run, give its -progressive again")
+        return stages
+    saved = [int(k) for k in state['stages']] or None
+    if stages is not None and stages != saved:
+        raise SystemExit("-progressive does not match the stages of checkpoint " + args.resume)
+    return saved
+
+def stages_too_large(args, d):
+    """ True if the first progressive stage is larger than the lattice """
+    return getattr(args, 'progressive', None) is not None and args.progressive[0] > d
+
+def main(args):
+    """
+        Main method for running a sieving algorithm. This method prints
+        the shortest vector found using the specified sieving algorithm
+
+        Parameters:
+            args:   Contains a Namespace object with arguments necessary for
+                    running a specific sieve
+
+    """
+    v = solve(args)
+
+    # The budget can run out before the sieve has seen a single vector
+    if v is None:
+        raise SystemExit("No vector found within the budget")
 
     # Print it along with its norm
     print(v, norm(v))
-    
 
 
-if __name__ == "__main__":
+def add_schedule_arguments(group):
+    """ Adds the gamma/N schedule arguments of the NV and double sieves """
+    group.add_argument('-schedule', choices=['fixed', 'adaptive'], default='fixed', help='Keep gamma fixed, or adapt gamma and the set size to the yield of every iteration (default fixed)')
+
+def add_mmap_argument(group):
+    """ Adds the out-of-core storage argument of the NV and double sieves """
+    group.add_argument('-mmap', metavar='file', help='Keep the sieve set in this memory-mapped .npy file instead of RAM; the next set is written to file.next and swapped in after every iteration')
+
+def build_parser():
+    """
+        Builds the command line parser of the sieves
+
+        Returns:
+            parser: The argparse.ArgumentParser
+    """
     # Make a parser
     parser = argparse.ArgumentParser(description='Module containing lattice sieving algorithms')
     
     # Add Ajtai basis generation arguments
     ajtai_group = parser.add_argument_group('Ajtai basis generation parameters')
-    ajtai_group.add_argument('-n', metavar='n', nargs=1, type=int, help='Number of vectors for Ajtai basis', required=True)
-    ajtai_group.add_argument('-r', metavar='r', nargs=1, type=int, help='Dimension of vectors for Ajtai basis', required=True)
-    ajtai_group.add_argument('-q', metavar='q', nargs=1, type=int, help='Prime modulus', required=True)
+    ajtai_group.add_argument('-n', metavar='n', nargs=1, type=int, help='Number of vectors for Ajtai basis (required unless resuming or loading a saved basis)')
+    ajtai_group.add_argument('-r', metavar='r', nargs=1, type=int, help='Dimension of vectors for Ajtai basis (required unless resuming or loading a saved basis)')
+    ajtai_group.add_argument('-q', metavar='q', nargs=1, type=int, help='Prime modulus (required unless resuming or loading a saved basis)')
+    parser.add_argument('--seed', metavar='seed', type=int, help='Seed for the basis and the vector sampler, for reproducible runs')
+    parser.add_argument('--sampler', choices=['gaussian', 'klein'], default='gaussian', help='Sampler for fresh vectors: rounded continuous Gaussian coefficients, or Klein\'s discrete Gaussian over the lattice (default gaussian)')
+    parser.add_argument('--sigma', metavar='sigma', type=float, help='Width of the sampler (default 2q for gaussian, the GPV bound for klein)')
+    parser.add_argument('--preprocess', metavar='lll|bkz:beta', help='Reduce the basis with LLL or with BKZ of block size beta before sampling')
+    parser.add_argument('--backend', choices=['numpy', 'numba'], default='numpy', help='Kernels for the pair search, the Gauss reduction and the NV center lookup: vectorized NumPy, or loops compiled with Numba if it is installed (default numpy)')
+
+    # Pre-generated inputs
+    input_group = parser.add_argument_group('Inputs')
+    input_group.add_argument('--basis-file', metavar='file', help='Load the basis from this .npy or fplll text file instead of generating one; -n, -r and -q default to the file.json written by --save-basis')
+    input_group.add_argument('--save-basis', metavar='file', help='Write the basis to this file before sieving (.npy, otherwise fplll text) and its parameters to file.json')
+    input_group.add_argument('--samples-file', metavar='file', help='Start the NV or double sieve from the vectors in this .npy file (or the array S of a .npz file) instead of sampling them')
+
+    # Checkpointing arguments
+    checkpoint_group = parser.add_argument_group('Checkpointing')
+    checkpoint_group.add_argument('--checkpoint', metavar='file', help='Periodically save the sieve state to this .npz file')
+    checkpoint_group.add_argument('--checkpoint-interval', metavar='seconds', type=float, default=600, help='Seconds between checkpoints (default 600)')
+    checkpoint_group.add_argument('--resume', metavar='file', help='Resume the sieve from a checkpoint file')
+
+    # Stopping arguments
+    stop_group = parser.add_argument_group('Stopping')
+    target_group = stop_group.add_mutually_exclusive_group()
+    target_group.add_argument('--target-norm', metavar='norm', type=float, help='Stop once a vector of at most this norm is found')
+    target_group.add_argument('--target-minkowski', metavar='f', type=float, help='Stop once a vector of at most f times the Minkowski bound is found (the double sieve uses f = 1 by default)')
+    target_group.add_argument('--target-planted', metavar='f', type=float, help='Stop once a vector of at most f times the norm of the planted vector is found')
+    stop_group.add_argument('--max-time', metavar='seconds', type=float, help='Stop after this many seconds')
+    stop_group.add_argument('--max-iterations', metavar='k', type=int, help='Stop after k iterations (loops for the Gauss sieve)')
+    stop_group.add_argument('--max-collisions', metavar='k', type=int, help='Stop after k collisions (zero vectors) in total')
+
+    # Instrumentation arguments
+    metrics_group = parser.add_argument_group('Instrumentation')
+    metrics_group.add_argument('--metrics-file', metavar='file', help='Write per-iteration metrics to this file (.csv for CSV, otherwise JSON Lines)')
+    metrics_group.add_argument('--metrics-every', metavar='k', type=int, default=1000, help='Record Gauss sieve metrics every k loops (default 1000)')
+    metrics_group.add_argument('--progress', action='store_true', help='Print a progress line after every record')
     
     # Make subparsers for the sieving algorithms
     subparsers = parser.add_subparsers(dest='subparser_name', title='Available sieving algorithms')
@@ -73,23 +386,113 @@ if __name__ == "__main__":
     # Ngyuen-Vidick sieve
     parser_nv = subparsers.add_parser('nv', help='The Nguyen-Vidick sieve')
     nv_group = parser_nv.add_argument_group('Arguments to NV sieve')
-    nv_group.add_argument('-N', metavar='N', nargs=1, type=int, help='Number of samples to draw', required=True)
+    nv_group.add_argument('-N', metavar='N', nargs=1, type=int, help='Number of samples to draw (required unless --samples-file is given or resuming)')
     nv_group.add_argument('-gamma', metavar='gamma', nargs=1, type=float, help='Constant used in norm reduction step', required=True)
+    nv_group.add_argument('-lsh', metavar=('tables', 'bits'), nargs=2, type=int, help='Look up centers with angular LSH using the given number of tables and hash bits')
+    nv_group.add_argument('-dedup', action='store_true', help='Drop duplicate vectors and negations from every iteration')
+    add_schedule_arguments(nv_group)
+    add_mmap_argument(nv_group)
     
     # Gauss sieve
     parser_gauss = subparsers.add_parser('gauss', help='The Gauss sieve')
     gauss_group = parser_gauss.add_argument_group('Arguments to Gauss sieve')
     gauss_group.add_argument('-c', metavar='c', nargs=1, type=int, help='Number of collisions', required=True)
+    gauss_group.add_argument('-workers', metavar='workers', type=int, default=1, help='Number of processes reducing candidates in batches (default 1, 0 = all cores)')
+    gauss_group.add_argument('-batch', metavar='batch', type=int, help='Candidates per batch with several workers (default 16 per worker)')
+    gauss_group.add_argument('-progressive', metavar=('k0', 'step'), nargs=2, type=int, help='Sieve progressively, from the sublattice of the first k0 basis vectors up to d in steps of step')
 
 
     # Double sieve
     parser_double = subparsers.add_parser('double', help='The Double Sieve')
     double_group = parser_double.add_argument_group('Arguments to the Double sieve')
-    double_group.add_argument('-N', metavar='N', nargs=1, type=int, help='Number of samples to draw (optional). Default is 2^(0.415*d).')
+    double_group.add_argument('-N', metavar='N', nargs=1, type=int, help='Number of samples to draw (optional). Default is 2^(0.208*d), or 2^(0.189*d) with -k 3.')
     double_group.add_argument('-gamma', metavar='gamma', nargs=1, type=float, help='Constant used in norm reduction step', required=True)
+    double_group.add_argument('-tile', metavar='tile', type=int, default=512, help='Tile size of the pair search (default 512)')
+    double_group.add_argument('-workers', metavar='workers', type=int, default=1, help='Number of processes for the pair search (default 1, 0 = all cores)')
+    double_group.add_argument('-lsh', metavar=('tables', 'bits'), nargs=2, type=int, help='Search pairs with angular LSH using the given number of tables and hash bits')
+    double_group.add_argument('-dedup', action='store_true', help='Drop duplicate vectors and negations from every iteration')
+    double_group.add_argument('-compact', action='store_true', help='Store vectors in the narrowest integer dtype that fits and prefilter pairs in float32')
+    double_group.add_argument('-k', type=int, choices=[2, 3], default=2, help='Reduce pairs (2), or pairs and triples (3) with a smaller set (default 2)')
+    double_group.add_argument('-alpha', metavar='alpha', type=float, default=0.3, help='Only extend pairs with |cos| of at least alpha to triples with -k 3 (default 0.3)')
+    add_schedule_arguments(double_group)
+    add_mmap_argument(double_group)
+    double_group.add_argument('-progressive', metavar=('k0', 'step'), nargs=2, type=int, help='Sieve progressively, from the sublattice of the first k0 basis vectors up to d in steps of step')
 
+    return parser
 
+def parse_args(argv=None):
+    """
+        Parses and checks a command line
+
+        Parameters:
+            argv:   List of arguments, sys.argv[1:] by default
+
+        Returns:
+            args:   Namespace with the parsed arguments
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    for message in check_args(args):
+        parser.error(message)
+    return args
+
+def check_args(args):
+    """
+        Checks the parsed arguments, before any basis or vector is allocated
+
+        Parameters:
+            args:       Namespace with the parsed arguments
+
+        Returns:
+            messages:   The problems found, empty if the arguments are fine
+    """
+    sieve = args.subparser_name
+    arg = lambda name: getattr(args, name, None)
+    first = lambda name: arg(name)[0] if arg(name) is not None else None
+    N, gamma, c, progressive = first('N'), first('gamma'), first('c'), arg('progressive')
+    checks = [
+        (args.resume is not None and (args.basis_file is not None or args.samples_file is not None),
+         "--basis-file and --samples-file cannot be used when resuming, the checkpoint holds the basis and the set"),
+        (args.resume is None and None in (args.n, args.r, args.q)
+         and (args.basis_file is None or not os.path.isfile(args.basis_file + '.json')),
+         "-n, -r and -q are required unless resuming from a checkpoint or loading a --basis-file written with --save-basis"),
+        (args.n is not None and args.n[0] < 1 or args.r is not None and args.r[0] < 1, "-n and -r must be positive"),
+        (args.q is not None and args.q[0] < 2, "-q must be at least 2"),
+        (args.preprocess is not None and not (args.preprocess == 'lll' or args.preprocess.startswith('bkz:') and args.preprocess[4:].isdigit()
+                                              and int(args.preprocess[4:]) >= 2),
+         "--preprocess must be lll or bkz:beta with an integer beta >= 2"),
+        (args.sigma is not None and args.sigma <= 0, "--sigma must be positive"),
+        (args.backend == "numba" and importlib.util.find_spec("numba") is None, "--backend numba needs the numba package"),
+        (args.checkpoint_interval < 0, "--checkpoint-interval must not be negative"),
+        (args.metrics_every < 1, "--metrics-every must be positive"),
+        (args.max_time is not None and args.max_time <= 0, "--max-time must be positive"),
+        (args.max_iterations is not None and args.max_iterations < 1, "--max-iterations must be at least 1"),
+        (args.max_collisions is not None and args.max_collisions < 1, "--max-collisions must be at least 1"),
+        (sieve == "nv" and args.schedule == "adaptive" and args.max_iterations is None and args.max_time is None,
+         "the adaptive schedule keeps the NV set from running empty, so it needs --max-iterations or --max-time"),
+        (sieve == "nv" and N is None and args.samples_file is None and args.resume is None,
+         "-N is required unless --samples-file is given or resuming"),
+        (args.samples_file is not None and sieve not in ("nv", "double"), "--samples-file only applies to the nv and double sieves"),
+        (args.samples_file is not None and progressive is not None, "--samples-file cannot be combined with -progressive"),
+        (N is not None and N < 1, "-N must be positive"),
+        (gamma is not None and gamma <= 0, "-gamma must be positive"),
+        (c is not None and c < 1, "-c must be positive"),
+        (arg('tile') is not None and arg('tile') < 1, "-tile must be positive"),
+        (arg('workers') is not None and arg('workers') < 0, "-workers must not be negative"),
+        (arg('batch') is not None and arg('batch') < 1, "-batch must be positive"),
+        (arg('lsh') is not None and min(arg('lsh')) < 1, "-lsh needs a positive number of tables and bits"),
+        (arg('alpha') is not None and not 0 <= arg('alpha') <= 1, "-alpha must be between 0 and 1"),
+        (progressive is not None and min(progressive) < 1, "-progressive needs a positive k0 and step"),
+        (progressive is not None and None not in (args.n, args.r) and args.basis_file is None and args.resume is None
+         and stages_too_large(args, args.n[0] + args.r[0]), "-progressive k0 must be at most n + r"),
+    ]
+    messages = [message for failed, message in checks if failed]
+    for path in (args.resume, args.basis_file, args.samples_file):
+        if path is not None and not os.path.isfile(path):
+            messages.append("No such file: " + path)
+    return messages
+
+if __name__ == "__main__":
     # Parse the args and call main
-    args = parser.parse_args()
-    parser.print_help() if args.subparser_name == None else main(args)
-    
\ No newline at end of file
+    args = parse_args()
+    build_parser().print_help() if args.subparser_name == None else main(args)
@@ -0,0 +1,426 @@
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+def sq_norms(V):
+    """
+        Computes the squared Euclidean norm of every row of a matrix
+
+        Parameters:
+            V:  Matrix whose rows are vectors
+
+        Returns:
+            n:  float64 array with the squared norm of each row
+    """
+    return np.einsum('ij,ij->i', V, V, dtype=np.float64)
+
+def sq_norm(v):
+    """
+        Computes the squared Euclidean norm of a single vector
+
+        Parameters:
+            v:  The vector
+
+        Returns:
+            n:  Squared norm of v as a float
+    """
+    return float(np.einsum('i,i->', v, v, dtype=np.float64))
+
+# Storage dtypes of a narrow database, from the narrowest
+NARROW_DTYPES = [np.dtype(np.int8), np.dtype(np.int16), np.dtype(np.int32), np.dtype(np.int64)]
+
+def narrow_dtype(max_abs):
+    """
+        The narrowest integer dtype that holds every value of absolute value at
+        most max_abs (so its minimum, which has no negation, is never stored)
+    """
+    for dtype in NARROW_DTYPES:
+        if max_abs <= np.iinfo(dtype).max:
+            return dtype
+    raise OverflowError("Entries of absolute value %d do not fit in int64" % max_abs)
+
+class VectorIndex:
+    """
+        Hash set of vectors up to sign. Every vector is flipped so that its
+        first nonzero entry is positive and hashed to 64 bits with a fixed
+        random linear form over the integers mod 2^64, so v and -v get the same
+        key. Two different vectors share a key with probability about 2^-64,
+        in which case one of them is dropped as a duplicate, which is harmless
+        for a sieve.
+
+        Attributes:
+            offered:    Number of nonzero vectors passed to add()
+            rejected:   Number of them that were duplicates or negations
+    """
+
+    def __init__(self, d):
+        self._w = np.random.default_rng(0).integers(0, 2**63, d, dtype=np.uint64)*np.uint64(2) + np.uint64(1)
+        self._keys = set()
+        self.offered = 0
+        self.rejected = 0
+
+    def keys(self, V):
+        """ The sign-canonical 64-bit hashes of the rows of V """
+        V = np.asarray(V, dtype=np.int64)
+        sign = np.sign(V[np.arange(len(V)), np.argmax(V != 0, axis=1)])
+        sign[sign == 0] = 1
+        return (V*sign[:, None]).astype(np.uint64) @ self._w
+
+    def add(self, V):
+        """
+            Adds the rows of V that are not yet in the set, up to sign. Zero
+            rows are always kept, the sieves count and remove them separately.
+
+            Parameters:
+                V:      Matrix of vectors
+
+            Returns:
+                keep:   Boolean mask of the rows that were new, counting only
+                        the first of several equal rows of V
+        """
+        V = np.asarray(V)
+        nonzero = np.flatnonzero(np.any(V != 0, axis=1))
+        keys, first = np.unique(self.keys(V[nonzero]), return_index=True)
+        new = np.array([k not in self._keys for k in keys.tolist()], dtype=bool)
+        self._keys.update(keys[new].tolist())
+        keep = np.ones(len(V), dtype=bool)
+        keep[nonzero] = False
+        keep[nonzero[first[new]]] = True
+        self.offered += len(nonzero)
+        self.rejected += len(nonzero) - int(new.sum())
+        return keep
+
+    def rate(self):
+        """ Fraction of the offered vectors that were rejected """
+        return self.rejected / self.offered if self.offered else 0.0
+
+class SieveDatabase:
+    """
+        Working set of a sieve. The vectors are stored as the rows of one
+        contiguous integer matrix, and their squared norms are cached in a
+        parallel array so that no sieve has to call norm() on the same vector
+        more than once. Rows are appended with amortized O(1) cost (the storage
+        doubles when full) and removed by swapping the last row into the hole,
+        so the order of the vectors is not preserved across removals.
+
+        With dedup set, a VectorIndex is attached and append() and extend()
+        silently drop vectors that are already in the database up to sign.
+        Keys are not removed with the vectors, so a vector that was removed
+        cannot be added again.
+
+        With narrow set, dtype is only the starting dtype of the storage: every
+        vector added is checked against the range of the current dtype, and the
+        storage is widened (int8, int16, int32, int64) when it does not fit, so
+        nothing ever overflows. Small vectors then take a fraction of the memory
+        and bandwidth of int64. Arithmetic on the stored vectors must widen them
+        first, see pair_search.combine().
+
+        With path set, the vectors live in a memory-mapped .npy file instead of
+        RAM, so the set can be larger than memory; the squared norms, 8 bytes
+        per vector, stay in RAM. Growing the storage writes a new file that
+        replaces the old one. Searches over a mapped set should stream it in
+        contiguous blocks of rows, as pair_search.reducible_pairs() does.
+
+        Attributes:
+            d:      Dimension of the vectors
+            dtype:  Integer dtype of the storage matrix
+            size:   Number of vectors currently in the database
+            index:  The VectorIndex, or None without dedup
+            narrow: Widen the storage on demand instead of assuming dtype fits
+            path:   The .npy file holding the vectors, or None to keep them in RAM
+    """
+
+    def __init__(self, d, capacity=16, dtype=np.int64, dedup=False, narrow=False, path=None):
+        self.d = d
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self.index = VectorIndex(d) if dedup else None
+        self.narrow = narrow
+        self.path = path
+        self._vecs = self._alloc(max(capacity, 1), self.dtype)
+        self._sq_norms = np.zeros(max(capacity, 1), dtype=np.float64)
+
+    @classmethod
+    def from_vectors(cls, S, d=None, dtype=np.int64, narrow=False, path=None):
+        """
+            Builds a database from a list of vectors, a 2-D array or another database
+
+            Parameters:
+                S:      The vectors
+                d:      Dimension, only needed when S is empty
+                dtype:  Integer dtype of the storage matrix
+                narrow: Store the vectors in the narrowest dtype that fits them
+                path:   Memory-map the vectors to this .npy file
+
+            Returns:
+                db:     The new database, S itself if it already is a database
+                        (a narrow one when narrow is set, a mapped one when
+                        path is set)
+        """
+        if isinstance(S, SieveDatabase):
+            if (S.narrow or not narrow) and (S.path is not None or path is None):
+                return S
+            S = S.vectors
+        V = np.asarray(S, dtype=dtype)
+        if V.size == 0:
+            V = V.reshape(0, d if d is not None else 0)
+        if narrow:
+            dtype = narrow_dtype(int(np.abs(V).max(initial=0)))
+        db = cls(V.shape[1], capacity=len(V), dtype=dtype, narrow=narrow, path=path)
+        db.extend(V)
+        return db
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("SieveDatabase index out of range")
+        return self._vecs[i]
+
+    def __iter__(self):
+        return iter(self._vecs[:self.size])
+
+    @property
+    def vectors(self):
+        """ View of the stored vectors as an (size, d) matrix """
+        return self._vecs[:self.size]
+
+    @property
+    def sq_norms(self):
+        """ View of the cached squared norms """
+        return self._sq_norms[:self.size]
+
+    def norms(self):
+        """ Euclidean norms of the stored vectors """
+        return np.sqrt(self.sq_norms)
+
+    def _alloc(self, rows, dtype):
+        # Zeroed storage for the vectors, in RAM or in a new file that replaces
+        # the one at path. A mapping of the old file stays readable until it
+        # is dropped, so the rows can still be copied over.
+        if self.path is None:
+            return np.zeros((rows, self.d), dtype=dtype)
+        tmp = self.path + '.tmp'
+        vecs = open_memmap(tmp, mode='w+', dtype=dtype, shape=(rows, self.d))
+        os.replace(tmp, self.path)
+        return vecs
+
+    def _fit(self, V):
+        # Widens the storage of a narrow database until the values of V fit
+        if not self.narrow or V.size == 0:
+            return
+        m = int(np.abs(np.asarray(V, dtype=np.int64)).max())
+        if m > np.iinfo(self.dtype).max:
+            self.dtype = narrow_dtype(m)
+            vecs = self._alloc(len(self._vecs), self.dtype)
+            vecs[:self.size] = self._vecs[:self.size]
+            self._vecs = vecs
+
+    def _reserve(self, capacity):
+        # Double the storage until it can hold the requested number of rows
+        if capacity <= len(self._vecs):
+            return
+        new_cap = max(capacity, 2*len(self._vecs))
+        vecs = self._alloc(new_cap, self.dtype)
+        vecs[:self.size] = self._vecs[:self.size]
+        norms = np.zeros(new_cap, dtype=np.float64)
+        norms[:self.size] = self._sq_norms[:self.size]
+        self._vecs, self._sq_norms = vecs, norms
+
+    def append(self, v, sq=None):
+        """
+            Adds a vector to the database
+
+            Parameters:
+                v:  The vector
+                sq: Its squared norm, computed if not given
+
+            Returns:
+                i:  Index of the new vector, None if it was a duplicate
+        """
+        if self.index is not None and not self.index.add(np.reshape(v, (1, self.d)))[0]:
+            return None
+        self._fit(v)
+        self._reserve(self.size + 1)
+        i = self.size
+        self._vecs[i] = v
+        self._sq_norms[i] = sq_norm(self._vecs[i]) if sq is None else sq
+        self.size += 1
+        return i
+
+    def insert_sorted(self, v, sq=None):
+        """
+            Inserts a vector so that a database sorted by norm stays sorted.
+            The rows after the insertion point are shifted with one block copy.
+
+            Parameters:
+                v:  The vector
+                sq: Its squared norm, computed if not given
+
+            Returns:
+                i:  Index of the new vector
+        """
+        sq = sq_norm(v) if sq is None else sq
+        self._fit(v)
+        self._reserve(self.size + 1)
+        i = int(np.searchsorted(self._sq_norms[:self.size], sq, side='right'))
+        self._vecs[i+1:self.size+1] = self._vecs[i:self.size]
+        self._sq_norms[i+1:self.size+1] = self._sq_norms[i:self.size]
+        self._vecs[i] = v
+        self._sq_norms[i] = sq
+        self.size += 1
+        return i
+
+    def extend(self, V, sq=None):
+        """
+            Adds all rows of a matrix to the database
+
+            Parameters:
+                V:  Matrix of vectors
+                sq: Their squared norms, computed if not given
+        """
+        V = np.asarray(V)
+        if self.index is not None and len(V):
+            keep = self.index.add(V)
+            V, sq = V[keep], (None if sq is None else np.asarray(sq)[keep])
+        self._extend(V, sq)
+
+    def _extend(self, V, sq):
+        # Appends the rows without looking at the index
+        if len(V) == 0:
+            return
+        self._fit(V)
+        self._reserve(self.size + len(V))
+        end = self.size + len(V)
+        self._vecs[self.size:end] = V
+        self._sq_norms[self.size:end] = sq_norms(self._vecs[self.size:end]) if sq is None else sq
+        self.size = end
+
+    def swap_remove(self, i):
+        """
+            Removes the vector at index i in O(1) by moving the last vector
+            into its place
+
+            Parameters:
+                i:  Index of the vector to remove
+
+            Returns:
+                v:  Copy of the removed vector
+        """
+        v = self[i].copy()
+        last = self.size - 1
+        if i != last:
+            self._vecs[i] = self._vecs[last]
+            self._sq_norms[i] = self._sq_norms[last]
+        self.size = last
+        return v
+
+    def compact(self, keep, block=65536):
+        """
+            Keeps only the vectors selected by a boolean mask, preserving their
+            order. The rows are moved down in place, block rows at a time, so a
+            mapped set is never copied into RAM as a whole.
+
+            Parameters:
+                keep:   Boolean mask of length size
+                block:  Number of rows moved at a time
+        """
+        idx = np.flatnonzero(keep)
+        m = len(idx)
+        # Row idx[j] >= j moves to row j, so a block never overwrites a row
+        # that a later block still has to read
+        for b in range(0, m, block):
+            self._vecs[b:min(b + block, m)] = self._vecs[idx[b:b+block]]
+        self._sq_norms[:m] = self._sq_norms[idx]
+        self.size = m
+
+    def flush(self):
+        """ Writes the vectors of a mapped database to its file """
+        if self.path is not None:
+            self._vecs.flush()
+
+    def move(self, path):
+        """
+            Renames the file of a mapped database, replacing whatever is at
+            path. Mappings of the replaced file, e.g. the previous sieve set,
+            stay valid until they are dropped.
+
+            Parameters:
+                path:   The new file
+        """
+        self.flush()
+        os.replace(self.path, path)
+        self.path = path
+
+    def unlink(self):
+        """ Removes the file of a mapped database, which must not be used afterwards """
+        if self.path is not None:
+            os.remove(self.path)
+
+    def mean_norm(self):
+        """ Mean Euclidean norm of the stored vectors """
+        return float(self.norms().mean()) if self.size else 0.0
+
+class Reservoir(SieveDatabase):
+    """
+        Fixed-capacity database filled from a stream of vectors by reservoir
+        sampling: after any number of offer() calls it holds a uniform random
+        subset of min(capacity, seen) of all the vectors offered, so the stream
+        never has to be materialized. The number of vectors offered and the sum
+        of their norms are accumulated on the way, for the exact mean norm of
+        the whole stream. With dedup set, duplicates and negations of vectors
+        offered earlier are dropped before they reach the reservoir.
+
+        Attributes:
+            capacity:   Maximum number of vectors kept
+            seen:       Number of distinct vectors offered so far
+            rng:        The numpy Generator deciding which vectors are kept
+    """
+
+    def __init__(self, d, capacity, dtype=np.int64, rng=None, dedup=False, narrow=False, path=None):
+        super().__init__(d, capacity, dtype, dedup, narrow, path)
+        self.capacity = capacity
+        self.seen = 0
+        self.rng = np.random.default_rng(rng)
+        self._norm_sum = 0.0
+
+    def offer(self, V, sq=None):
+        """
+            Offers a batch of vectors to the reservoir (Algorithm R, one batch at a time)
+
+            Parameters:
+                V:  Matrix of vectors
+                sq: Their squared norms, computed if not given
+        """
+        V = np.asarray(V)
+        sq = sq_norms(V) if sq is None else np.asarray(sq)
+        if self.index is not None and len(V):
+            keep = self.index.add(V)
+            V, sq = V[keep], sq[keep]
+        if len(V) == 0:
+            return
+        self._norm_sum += float(np.sqrt(sq).sum())
+
+        # Fill the free slots first
+        free = min(self.capacity - self.size, len(V))
+        self._extend(V[:free], sq[:free])
+
+        # The t-th vector of the stream (0-based) replaces a random slot with
+        # probability capacity/(t+1). When several vectors of the batch pick the
+        # same slot the last one wins, as if they had been offered one by one.
+        t = self.seen + free + np.arange(len(V) - free)
+        slot = np.floor(self.rng.random(len(t)) * (t + 1)).astype(np.int64)
+        hit = np.flatnonzero(slot < self.capacity)
+        slot, last = np.unique(slot[hit][::-1], return_index=True)
+        src = free + hit[::-1][last]
+        self._fit(V[src])
+        self._vecs[slot] = V[src]
+        self._sq_norms[slot] = sq[src]
+        self.seen += len(V)
+
+    def stream_mean_norm(self):
+        """ Mean Euclidean norm of all the distinct vectors offered so far """
+        return self._norm_sum / self.seen if self.seen else 0.0
@@ -0,0 +1,100 @@
+import time
+import numpy as np
+
+class BestVector:
+    """
+        Shortest vector seen so far by a sieve. Offering a vector costs O(1),
+        offering a whole SieveDatabase one pass over its cached norms.
+
+        Attributes:
+            v:      Copy of the shortest vector, None before the first offer
+            sq:     Its squared norm, inf before the first offer
+    """
+
+    def __init__(self):
+        self.v = None
+        self.sq = np.inf
+
+    def offer(self, v, sq):
+        """
+            Keeps v if it is shorter than the best so far. Zero vectors are ignored.
+
+            Returns:
+                True if v is the new best
+        """
+        if 0 < sq < self.sq:
+            self.v, self.sq = np.array(v, dtype=np.int64), float(sq)
+            return True
+        return False
+
+    def offer_db(self, db):
+        """ Offers the shortest nonzero vector of a sieve_db.SieveDatabase """
+        if len(db):
+            sq = np.where(db.sq_norms > 0, db.sq_norms, np.inf)
+            i = int(np.argmin(sq))
+            self.offer(db[i], sq[i])
+
+    def norm(self):
+        """ Norm of the best vector """
+        return float(np.sqrt(self.sq))
+
+class StopPolicy:
+    """
+        Common stopping rule of the sieves: stop once the best vector is at
+        most the target norm, or once the wall time, the number of iterations
+        (loops for the Gauss sieve) or the number of collisions (zero vectors)
+        exceeds its budget. Any of these can be None for no limit.
+
+        Attributes:
+            target:         Target norm
+            max_time:       Wall-clock budget in seconds, counted from construction
+            max_iterations: Iteration budget
+            max_collisions: Collision budget
+    """
+
+    def __init__(self, target=None, max_time=None, max_iterations=None, max_collisions=None):
+        self.target = target
+        self.max_time = max_time
+        self.max_iterations = max_iterations
+        self.max_collisions = max_collisions
+        self._start = time.perf_counter()
+
+    def reached(self, best):
+        """ True if the best vector meets the target norm """
+        return self.target is not None and best.sq <= self.target*self.target
+
+    def exhausted(self, iterations=0, collisions=0):
+        """ True once one of the budgets is used up """
+        if self.max_iterations is not None and iterations >= self.max_iterations:
+            return True
+        if self.max_collisions is not None and collisions >= self.max_collisions:
+            return True
+        return self.max_time is not None and time.perf_counter() - self._start >= self.max_time
+
+    def done(self, best, iterations=0, collisions=0):
+        """ True if the sieve should stop """
+        return self.reached(best) or self.exhausted(iterations, collisions)
+
+def target_norm(norm=None, minkowski=None, planted=None, minkowski_bound=None, w=None):
+    """
+        Resolves a target norm given in one of three ways
+
+        Parameters:
+            norm:               Absolute target norm
+            minkowski:          Factor of the Minkowski bound
+            planted:            Factor of the norm of the planted vector w
+            minkowski_bound:    The Minkowski bound of the lattice
+            w:                  The planted short vector from gen_basis()
+
+        Returns:
+            target:             The target norm, None if none is given
+    """
+    if norm is not None:
+        return norm
+    if minkowski is not None:
+        return minkowski*minkowski_bound
+    if planted is not None:
+        if w is None:
+            raise ValueError("The planted vector is unknown for this basis")
+        return planted*float(np.linalg.norm(w))
+    return None
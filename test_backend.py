@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from sieve_db import sq_norms
+from sieve import parse_args, solve
+from backend import NumpyBackend, get_backend
+
+numba = pytest.importorskip("numba")
+
+def vectors(rng, N, d, dtype, spread=4):
+    # Random rows with some duplicates and negations, which the kernels must not
+    # report as reducing to zero
+    V = rng.integers(-spread, spread + 1, (N, d))
+    V[1::7] = V[::7][:len(V[1::7])]
+    V[2::7] = -V[::7][:len(V[2::7])]
+    return V.astype(dtype)
+
+@pytest.fixture
+def numba_backend():
+    return get_backend('numba')
+
+@pytest.mark.parametrize('dtype', [np.int8, np.int16, np.int64])
+@pytest.mark.parametrize('diagonal', [True, False])
+@pytest.mark.parametrize('prefilter', [True, False])
+def test_tile_pairs(numba_backend, dtype, diagonal, prefilter):
+    rng = np.random.default_rng(1)
+    A = vectors(rng, 60, 12, dtype)
+    B = A if diagonal else np.concatenate((A[:20], -A[20:30], vectors(rng, 40, 12, dtype)))
+    sq_A, sq_B = sq_norms(A), sq_norms(B)
+    gR2 = float(np.median(sq_A))
+    expected = NumpyBackend.tile_pairs(A, sq_A, B, sq_B, gR2, diagonal, prefilter)
+    found = numba_backend.tile_pairs(A, sq_A, B, sq_B, gR2, diagonal, prefilter)
+    assert len(expected[0]) > 0
+    for e, f in zip(expected, found):
+        np.testing.assert_array_equal(e, f)
+
+@pytest.mark.parametrize('dtype', [np.int16, np.int64])
+def test_reduce_by(numba_backend, dtype):
+    rng = np.random.default_rng(2)
+    V = vectors(rng, 80, 10, dtype, spread=6)
+    V = V[np.any(V != 0, axis=1)]
+    sq = sq_norms(V)
+    order = np.argsort(sq, kind='stable')
+    V, sq = V[order], sq[order]
+    for _ in range(50):
+        p = rng.integers(-40, 41, 10)
+        p_np, sq_np = NumpyBackend.reduce_by(p.copy(), V, sq)
+        p_nb, sq_nb = numba_backend.reduce_by(p.copy(), V, sq)
+        np.testing.assert_array_equal(p_np, p_nb)
+        assert sq_np == sq_nb
+
+@pytest.mark.parametrize('dtype', [np.int8, np.int16, np.int64])
+def test_first_close(numba_backend, dtype):
+    rng = np.random.default_rng(3)
+    V = vectors(rng, 100, 8, dtype)
+    for _ in range(100):
+        v = rng.integers(-4, 5, 8).astype(dtype)
+        gR2 = float(rng.integers(5, 60))
+        assert NumpyBackend.first_close(V, v, gR2) == numba_backend.first_close(V, v, gR2)
+    # No close row at all
+    assert numba_backend.first_close(V, np.full(8, 100, dtype=np.int64), 1.0) == -1
+
+@pytest.mark.parametrize('sieve', [
+    ['gauss', '-c', '5'],
+    ['gauss', '-c', '5', '-workers', '2'],
+    ['nv', '-N', '300', '-gamma', '0.9'],
+    ['double', '-N', '400', '-gamma', '0.9'],
+    ['double', '-N', '300', '-gamma', '0.9', '-k', '3', '-compact'],
+])
+def test_same_vector(sieve, capsys):
+    # A seeded run finds the same vector with either backend
+    argv = ['-n', '10', '-r', '8', '-q', '31', '--seed', '3']
+    v_np = solve(parse_args(argv + ['--backend', 'numpy'] + sieve))
+    v_nb = solve(parse_args(argv + ['--backend', 'numba'] + sieve))
+    np.testing.assert_array_equal(v_np, v_nb)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from sieve import parse_args, solve, main
+from g_sieve import gauss_sieve
+from k_sieve import double_sieve
+from sample import GaussianSampler
+from metrics import Metrics
+from ajtai_generator import gen_basis
+from stopping import StopPolicy
+
+ARGV = ['-n', '10', '-r', '5', '-q', '17', '--seed', '2']
+
+def test_gauss_zero_budget():
+    # The budget is used up before any vector enters L
+    basis, _ = gen_basis(10, 5, 17, 2)
+    assert gauss_sieve(basis, 3, rng=2, params=(10, 5, 17), stop=StopPolicy(max_time=1e-9)) is None
+
+def test_main_without_vector():
+    with pytest.raises(SystemExit) as e:
+        main(parse_args(ARGV + ['--max-time', '1e-9', 'gauss', '-c', '3']))
+    assert e.value.code == "No vector found within the budget"
+
+@pytest.mark.parametrize('budget', [['--max-iterations', '0'], ['--max-collisions', '0'], ['--max-time', '0']])
+def test_zero_budget_rejected(budget, capsys):
+    with pytest.raises(SystemExit):
+        parse_args(ARGV + budget + ['gauss', '-c', '3'])
+    assert "must be" in capsys.readouterr().err
+
+@pytest.mark.parametrize('sieve', [['nv', '-N', '50', '-gamma', '0.9'], ['double', '-N', '50', '-gamma', '0.9']])
+def test_set_sieves_zero_budget(sieve):
+    # The NV and double sieves start from a sampled set, so they always have a vector
+    v = solve(parse_args(ARGV + ['--max-time', '1e-9'] + sieve))
+    assert v is not None and np.any(v != 0)
+
+def test_double_resume_refills_to_original_size():
+    # A resumed set can be smaller than the starting one; the next stage still
+    # refills it to the original size
+    basis, _ = gen_basis(10, 8, 31, 3)
+    sampler = GaussianSampler(basis, 10, 8, 31, rng=3)
+    sampler.restrict(8)
+    sizes = []
+    double_sieve(sampler.sample(50), 0.9, 1.0, rng=3, metrics=Metrics(callback=lambda row: sizes.append(row['size'])),
+                 stages=[8, 12, 18], sampler=sampler, stop=StopPolicy(max_iterations=1), size=200)
+    assert sizes == [200]
+
+@pytest.mark.parametrize('sieve', [['gauss', '-c', '10'], ['double', '-N', '300', '-gamma', '0.9']])
+def test_resume_progressive(sieve, tmp_path):
+    # The stages come from the checkpoint, so -progressive need not be repeated
+    argv = ['-n', '10', '-r', '8', '-q', '31', '--seed', '3']
+    progressive = ['-progressive', '10', '4']
+    v = solve(parse_args(argv + sieve + progressive))
+    ck = str(tmp_path / 'ck.npz')
+    solve(parse_args(argv + ['--checkpoint', ck, '--checkpoint-interval', '0', '--max-iterations', '5'] + sieve + progressive))
+    np.testing.assert_array_equal(solve(parse_args(['--resume', ck] + sieve)), v)
+    with pytest.raises(SystemExit):
+        solve(parse_args(['--resume', ck] + sieve + ['-progressive', '9', '4']))
+
+@pytest.mark.parametrize('workers', ['2', '3'])
+def test_double_parallel_matches_serial(workers):
+    # The tiles do not depend on the number of workers, so a seeded run finds
+    # the same vector in parallel
+    argv = ['-n', '10', '-r', '8', '-q', '31', '--seed', '3']
+    sieve = ['double', '-N', '300', '-gamma', '0.9']
+    v = solve(parse_args(argv + sieve + ['-workers', '1']))
+    np.testing.assert_array_equal(solve(parse_args(argv + sieve + ['-workers', workers])), v)
+
+def test_mmap_files_removed_on_error(tmp_path, monkeypatch):
+    # A step that does not finish removes its .next and .centers files; only the
+    # last complete set stays at the mapped path
+    import nv_sieve, k_sieve
+    basis, _ = gen_basis(10, 5, 17, 2)
+    S = GaussianSampler(basis, 10, 5, 17, rng=2).sample(100)
+
+    def center_then_fail(C, v, gR, index, backend):
+        C.append(v)
+        raise RuntimeError
+    monkeypatch.setattr(nv_sieve, 'exists_close_center', center_then_fail)
+    with pytest.raises(RuntimeError):
+        nv_sieve.nguyen_vidick_sieve(S, 0.01, rng=2, mmap=str(tmp_path / 'nv.npy'))
+
+    def pairs_then_fail(S, *args):
+        yield S.vectors[:10], S.sq_norms[:10]
+        raise RuntimeError
+    monkeypatch.setattr(k_sieve, '_pair_source', pairs_then_fail)
+    with pytest.raises(RuntimeError):
+        k_sieve.double_sieve(S, 0.9, 1.0, rng=2, mmap=str(tmp_path / 'double.npy'))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['double.npy', 'nv.npy']
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from sieve_db import SieveDatabase, Reservoir, narrow_dtype, sq_norms
+
+def random_vectors(N, d=6, seed=0, spread=9):
+    return np.random.default_rng(seed).integers(-spread, spread + 1, (N, d))
+
+def test_extend_grows_and_caches_norms():
+    V = random_vectors(100)
+    S = SieveDatabase(6, capacity=2)
+    S.extend(V[:40])
+    for v in V[40:]:
+        S.append(v)
+    np.testing.assert_array_equal(S.vectors, V)
+    np.testing.assert_array_equal(S.sq_norms, sq_norms(V))
+
+def test_swap_remove():
+    V = random_vectors(5)
+    S = SieveDatabase.from_vectors(V)
+    np.testing.assert_array_equal(S.swap_remove(1), V[1])
+    # The last vector fills the hole
+    np.testing.assert_array_equal(S.vectors, V[[0, 4, 2, 3]])
+    np.testing.assert_array_equal(S.sq_norms, sq_norms(V[[0, 4, 2, 3]]))
+    # Removing the last vector pops it
+    np.testing.assert_array_equal(S.swap_remove(len(S) - 1), V[3])
+    np.testing.assert_array_equal(S.vectors, V[[0, 4, 2]])
+    with pytest.raises(IndexError):
+        S.swap_remove(3)
+
+def test_swap_remove_returns_a_copy():
+    S = SieveDatabase.from_vectors(random_vectors(3))
+    v = S.swap_remove(2)
+    S.append(np.zeros(6, dtype=np.int64))
+    assert np.any(v != 0)
+
+@pytest.mark.parametrize('block', [1, 3, 64])
+@pytest.mark.parametrize('mapped', [False, True])
+def test_compact(block, mapped, tmp_path):
+    V = random_vectors(50)
+    keep = np.random.default_rng(1).random(50) < 0.5
+    S = SieveDatabase.from_vectors(V, path=str(tmp_path / 'S.npy') if mapped else None)
+    S.compact(keep, block=block)
+    np.testing.assert_array_equal(S.vectors, V[keep])
+    np.testing.assert_array_equal(S.sq_norms, sq_norms(V[keep]))
+    S.compact(np.zeros(len(S), dtype=bool), block=block)
+    assert len(S) == 0
+
+def test_insert_sorted():
+    V = random_vectors(30)
+    S = SieveDatabase(6)
+    for v in V:
+        S.insert_sorted(v)
+    assert np.all(np.diff(S.sq_norms) >= 0)
+    np.testing.assert_array_equal(S.sq_norms, sq_norms(S.vectors))
+
+def test_narrow_widens_on_demand():
+    S = SieveDatabase.from_vectors(random_vectors(10, spread=100), narrow=True)
+    assert S.dtype == np.int8
+    big = np.array([300, 0, 0, 0, 0, -1])
+    S.append(big)
+    assert S.dtype == np.int16
+    huge = np.full((2, 6), 2**40)
+    S.extend(huge)
+    assert S.dtype == np.int64
+    np.testing.assert_array_equal(S.vectors[10], big)
+    np.testing.assert_array_equal(S.vectors[11:], huge)
+    np.testing.assert_array_equal(S.vectors[:10], random_vectors(10, spread=100))
+    assert narrow_dtype(127) == np.int8 and narrow_dtype(128) == np.int16
+
+def test_mapped_growth(tmp_path):
+    path = str(tmp_path / 'S.npy')
+    V = random_vectors(100)
+    S = SieveDatabase(6, capacity=4, narrow=True, dtype=np.int8, path=path)
+    S.extend(V[:50])
+    S.extend(V[50:] * 1000)
+    S.flush()
+    np.testing.assert_array_equal(np.load(path)[:100], np.concatenate((V[:50], V[50:] * 1000)))
+
+def test_dedup_drops_negations():
+    V = random_vectors(10)
+    S = SieveDatabase(6, dedup=True)
+    S.extend(np.concatenate((V, -V, V[:3])))
+    np.testing.assert_array_equal(S.vectors, V)
+
+def test_reservoir_keeps_capacity():
+    R = Reservoir(6, 20, rng=0)
+    for i in range(10):
+        R.offer(random_vectors(10, seed=i))
+    assert len(R) == 20 and R.seen == 100
+    np.testing.assert_array_equal(R.sq_norms, sq_norms(R.vectors))
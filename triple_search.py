@@ -0,0 +1,94 @@
+import numpy as np
+from sieve_db import sq_norms
+
+def row_triples(x, sq_x, g, X, sq, gR2, alpha):
+    """
+        Finds the reducible triples x -+ v -+ w for one vector x and the rows
+        v, w of a block. Only rows whose angle with x is far from orthogonal,
+        |<x, v>| >= alpha |x| |v|, are used: the signs are chosen to shorten x
+        (v gets -sign(<x, v>)), and the squared norm of each triple is read off
+        the Gram matrix of the remaining rows,
+        |x + s_v v + s_w w|^2 = |x|^2 + |v|^2 + |w|^2 - 2|<x, v>| - 2|<x, w>| + 2 s_v s_w <v, w>
+
+        Parameters:
+            x:          The first vector of the triples
+            sq_x:       Its squared norm
+            g:          Inner products of x with the rows of X
+            X:          Block of candidate vectors (rows)
+            sq:         Squared norms of the rows of X
+            gR2:        Squared reduction bound (gamma * R)^2
+            alpha:      Minimum |cos| between x and the other two vectors
+
+        Returns:
+            J, K:       Row indices into X of the second and third vectors, J < K
+            sJ, sK:     Their signs, -1 or +1
+    """
+    J = np.flatnonzero(np.abs(g) >= alpha*np.sqrt(sq_x*sq))
+    if len(J) < 2:
+        return (np.zeros(0, dtype=np.intp),)*2 + (np.zeros(0, dtype=np.int8),)*2
+    s = np.where(g[J] > 0, -1, 1).astype(np.int8)
+    ag = np.abs(g[J])
+    Y = X[J].astype(np.float64)
+    T = sq_x + sq[J][:, None] + sq[J][None, :] - 2*ag[:, None] - 2*ag[None, :] + 2*np.outer(s, s)*(Y @ Y.T)
+    j, k = np.nonzero(np.triu(T <= gR2, 1))
+    return J[j], J[k], s[j], s[k]
+
+def reducible_triples(S, gR, alpha=0.3, tile=512):
+    """
+        Runs over all triples of S and yields the reduced vectors x -+ v -+ w
+        of norm at most gR, in the style of the triple sieve of Bai, Laarhoven
+        and Stehle. A tile x N block of the Gram matrix gives, for every x in
+        the tile, the vectors v and w after x whose angle with x is far enough
+        from orthogonal (see row_triples()), so only those pairs are extended
+        to triples. Each triple i < j < k is found once, from its first vector.
+        Triples reducing to zero are dropped; pairs are not reported here, see
+        pair_search.reducible_pairs(). The block is built a tile x tile piece
+        at a time, converting only the rows it multiplies, and only the
+        candidates of each row are kept, so a memory-mapped set is streamed.
+
+        Parameters:
+            S:      SieveDatabase to search
+            gR:     Reduction bound (gamma * R)
+            alpha:  Minimum |cos| of the pairs that are extended to triples
+            tile:   Number of rows of the Gram matrix block
+
+        Yields:
+            V, sq:  A block of reduced vectors and their squared norms
+    """
+    N = len(S)
+    X, sq = S.vectors, S.sq_norms
+    gR2 = gR*gR
+    blocks, found = [], 0
+    for t in range(0, N, tile):
+        A = X[t:t+tile].astype(np.float64)
+        rows = np.arange(t, min(t + tile, N))
+
+        # Inner products of the tile with the vectors after each of its rows,
+        # keeping the pairs far enough from orthogonal, ordered by row and then
+        # by column
+        R, C, g = [], [], []
+        for u in range(t, N, tile):
+            G = A @ X[u:u+tile].astype(np.float64).T
+            cols = np.arange(u, u + G.shape[1])
+            near = np.abs(G) >= alpha*np.sqrt(sq[rows][:, None]*sq[cols][None, :])
+            r, c = np.nonzero(near & (cols[None, :] > rows[:, None]))
+            R.append(r), C.append(c + u), g.append(G[r, c])
+        R, C, g = np.concatenate(R), np.concatenate(C), np.concatenate(g)
+        order = np.argsort(R, kind='stable')
+        C, g = C[order], g[order]
+        bounds = np.searchsorted(R[order], np.arange(len(rows) + 1))
+
+        for r, i in enumerate(rows):
+            P = C[bounds[r]:bounds[r+1]]
+            J, K, sJ, sK = row_triples(X[i], sq[i], g[bounds[r]:bounds[r+1]], X[P], sq[P], gR2, alpha)
+            if len(J):
+                J, K = P[J], P[K]
+                blocks.append(X[i].astype(np.int64) + sJ[:, None].astype(np.int64)*X[J] + sK[:, None].astype(np.int64)*X[K])
+                found += len(J)
+            # Hand over the reduced vectors about tile^2 at a time
+            if found >= tile*tile or (found and i == N - 1):
+                V = np.concatenate(blocks)
+                V = V[np.any(V != 0, axis=1)]
+                blocks, found = [], 0
+                if len(V):
+                    yield V, sq_norms(V)
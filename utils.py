@@ -1,75 +1,92 @@
 import numpy as np
-from multiprocessing import Pool
-from itertools import repeat
+from sieve_db import SieveDatabase, VectorIndex, sq_norms
 
-def remove_zeros(S):
+def keep_mask(V, sq=None, min_norm=None, max_norm=None, index=None):
     """
-        Removes zero vectors from the given list of vectors
+        Decides in one vectorized pass which rows of a matrix of vectors to keep:
+        the nonzero rows whose norm lies within the bounds and, with an index,
+        that are not duplicates or negations of a vector already seen
 
         Parameters:
-            S: List of vectors
+            V:          Matrix of vectors
+            sq:         Their squared norms, computed if not given
+            min_norm:   Drop vectors shorter than this
+            max_norm:   Drop vectors longer than this
+            index:      Optional sieve_db.VectorIndex for deduplication
 
-        Returns: 
-            S: The list with zero vectors removed
+        Returns:
+            keep:       Boolean mask of the rows to keep
     """
-    # Maintain a counter so we can account for shift in indices
-    # that happen due to the 'del' operation on a list
-    ct = 0
-    zero_indices = []
-    
-    # Loop and check for zero vectors
-    for i in range(len(S)):
-        if np.count_nonzero(S[i]) == 0:
-            zero_indices.append(i - ct)
-            ct += 1
+    keep = np.any(V != 0, axis=1)
+    if min_norm is not None or max_norm is not None:
+        sq = sq_norms(V) if sq is None else sq
+        if min_norm is not None:
+            keep &= sq >= min_norm*min_norm
+        if max_norm is not None:
+            keep &= sq <= max_norm*max_norm
+    if index is not None:
+        idx = np.flatnonzero(keep)
+        keep[idx] = index.add(V[idx])
+    return keep
 
-    # Loop over the 'corrected' indices and delete zero elements
-    for i in zero_indices:
-        del S[i]
-    
-    # Return the list
+def filter_vectors(S, min_norm=None, max_norm=None, dedup=False):
+    """
+        Removes zero vectors, None elements, vectors outside the norm bounds
+        and, with dedup, duplicates and negations from a set of vectors. The
+        vectors are stacked into one matrix, tested with keep_mask() and
+        compacted with a single fancy index.
+
+        Parameters:
+            S:          List of vectors (which may contain None), 2-D array or
+                        sieve_db.SieveDatabase
+            min_norm:   Drop vectors shorter than this
+            max_norm:   Drop vectors longer than this
+            dedup:      Keep only the first of vectors equal up to sign
+
+        Returns:
+            S:          The filtered set. Lists and databases are filtered in
+                        place, for an array a new array is returned.
+    """
+    if isinstance(S, SieveDatabase):
+        index = VectorIndex(S.d) if dedup else None
+        S.compact(keep_mask(S.vectors, S.sq_norms, min_norm, max_norm, index))
+        return S
+
+    if isinstance(S, np.ndarray):
+        index = VectorIndex(S.shape[1]) if dedup else None
+        return S[keep_mask(S, None, min_norm, max_norm, index)]
+
+    present = [v for v in S if v is not None]
+    if not present:
+        S[:] = []
+        return S
+    V = np.asarray(present)
+    index = VectorIndex(V.shape[1]) if dedup else None
+    keep = keep_mask(V, None, min_norm, max_norm, index)
+    S[:] = [v for v, k in zip(present, keep) if k]
     return S
 
-def par_remove_zeros_loop(S, i):
+def remove_zeros(S):
     """
-        Helper method for parallel execution of remove_zeros()
-        Simply checks the given index for the zero vector or 
-        value None
+        Removes zero vectors from the given list of vectors
 
         Parameters:
-            S: The set of vectors
-            i: Index to check
+            S: List of vectors
 
         Returns:
-            True if given index is 0 or None, else False
+            S: The list with zero vectors removed
     """
-    return S[i] is None or np.count_nonzero(S[i]) == 0
+    return filter_vectors(S)
 
 def par_remove_zeros(S):
     """
-        Removes zero vectors and None elements from the given 
+        Removes zero vectors and None elements from the given
         list of vectors
 
         Parameters:
             S: List of vectors
 
-        Returns: 
+        Returns:
             S: The list with zero vectors and None elements removed
     """
-    # Maintain a counter so we can account for shift in indices
-    # that happen due to the 'del' operation on a list
-    ct = 0
-    N = len(S)
-
-    # Start 16 processes to check which vectors are 0 or None
-    with Pool(16) as p:
-        res = p.starmap(par_remove_zeros_loop, zip(repeat(S, N), range(N)))
-
-    # Loop over the results and delete the right elements
-    for idx, val in enumerate(res):
-        if val:
-            del S[idx - ct]
-            ct += 1
-
-    # Return the new list    
-    return S
\ No newline at end of file
+    return filter_vectors(S)